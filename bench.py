@@ -0,0 +1,142 @@
+import argparse, json, os, resource, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from multiprocessing import get_context
+from parsel import Selector
+
+from bench_parse import FIXTURE_GLOB, synthetic_page
+from replay import FIXTURE_ROOT, FixtureStore
+from thread_parser import find_thread_items, parse_thread, scrape_thread_page
+
+REPEAT = 5
+REPLAY_TARGET = 500
+
+
+def load_pages(limit=None):
+    """Post pages from the fixture store, else data/fixtures/*.html, else one synthetic page."""
+    pages = list(FixtureStore(FIXTURE_ROOT).pages()) if os.path.exists(FIXTURE_ROOT) else []
+    source = FIXTURE_ROOT
+    if not pages:
+        pages = [open(p, encoding="utf-8").read() for p in glob(FIXTURE_GLOB)]
+        source = FIXTURE_GLOB
+    if not pages:
+        pages = [synthetic_page()]
+        source = "synthetic page (200 items, 2000 spans)"
+    return pages[:limit] if limit else pages, source
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def dedup_hit_rate(ids):
+    return 1 - len(set(ids)) / len(ids) if ids else 0.0
+
+
+def bench_scrape(limit=None):
+    pages, source = load_pages(limit)
+    ids = []
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        ids = [str(p.get("id")) for html in pages for p in scrape_thread_page(html)]
+    seconds = (time.perf_counter() - start) / REPEAT
+    return {
+        "bench": "scrape_thread_page", "source": source, "pages": len(pages), "posts": len(ids),
+        "posts_per_sec": len(ids) / seconds if seconds else 0.0,
+        "ms_per_page": seconds * 1000 / len(pages),
+        "dedup_hit_rate": dedup_hit_rate(ids),  # posts repeated across pages (parent thread, shared replies)
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_parse_thread(limit=None):
+    pages, source = load_pages(limit)
+    per_page = []
+    for html in pages:
+        items = []
+        for raw in Selector(text=html).css('script[type="application/json"][data-sjs]::text').getall():
+            if "thread_items" in raw:
+                items += [t for group in find_thread_items(json.loads(raw)) for t in group]
+        per_page.append(items)
+    n_items = sum(len(items) for items in per_page)
+    ids = []
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        ids = [str(p.get("id")) for items in per_page for p in map(parse_thread, items) if p]
+    seconds = (time.perf_counter() - start) / REPEAT
+    return {
+        "bench": "parse_thread", "source": source, "pages": len(pages), "posts": n_items,
+        "posts_per_sec": n_items / seconds if seconds else 0.0,
+        "ms_per_page": seconds * 1000 / len(pages),
+        "dedup_hit_rate": dedup_hit_rate(ids),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_replay(target=REPLAY_TARGET):
+    """Full run_autoscrape against the fixture store, writing into a throwaway save dir."""
+    import threads_autoscraper as scraper
+
+    if not os.path.exists(FIXTURE_ROOT) or not len(FixtureStore(FIXTURE_ROOT)):
+        return {"bench": "run_autoscrape replay", "skipped": f"no fixtures in {FIXTURE_ROOT}; record a run first"}
+    with tempfile.TemporaryDirectory() as root:
+        scraper.ROOT_SAVE_DIR = root + "/"
+        scraper.FIXTURE_MODE = "replay"
+        scraper.SCROLL_SLEEP = (0, 0)
+        scraper.TARGET_TOTAL = target
+        try:
+            stats = scraper.run_autoscrape()
+        except Exception as e:
+            return {"bench": "run_autoscrape replay", "skipped": f"{type(e).__name__}: {e}"}
+    latency = stats["post_latency_ms"]
+    return {
+        "bench": "run_autoscrape replay", "source": FIXTURE_ROOT, "pages": len(latency), "posts": stats["total"],
+        "posts_per_sec": stats["total"] / stats["seconds"] if stats["seconds"] else 0.0,
+        "ms_per_page": sum(latency) / len(latency) if latency else 0.0,  # fetch + parse per post page
+        "dedup_hit_rate": stats["duplicates"] / stats["parsed"] if stats["parsed"] else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+BENCHES = {"scrape": bench_scrape, "parse_thread": bench_parse_thread, "replay": bench_replay}
+
+
+def run_isolated(fn, *args):
+    """Run one benchmark in a fresh process so its peak RSS is its own."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def report(result):
+    if "skipped" in result:
+        print(f"{result['bench']:24s} skipped: {result['skipped']}")
+        return
+    print(f"{result['bench']:24s} {result['posts_per_sec']:10.0f} posts/s {result['ms_per_page']:9.2f} ms/page "
+          f"{result['dedup_hit_rate']:7.1%} dedup hits {result['peak_rss_mb']:8.1f} MB peak RSS "
+          f"({result['posts']} posts, {result['pages']} pages)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline parser and pipeline benchmarks over recorded fixtures.")
+    ap.add_argument("benches", nargs="*", help=f"any of {', '.join(BENCHES)} (default: all)")
+    ap.add_argument("--pages", type=int, default=None, help="limit the number of fixture pages parsed")
+    ap.add_argument("--target", type=int, default=REPLAY_TARGET, help="posts to collect in the replay run")
+    ap.add_argument("--json", help="also write the results to this file, for comparing runs")
+    args = ap.parse_args(argv)
+    unknown = set(args.benches) - set(BENCHES)
+    if unknown:
+        ap.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = []
+    for name in args.benches or BENCHES:
+        arg = args.target if name == "replay" else args.pages
+        result = run_isolated(BENCHES[name], arg)
+        report(result)
+        results.append(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json, sys, time
+from glob import glob
+import jmespath
+from nested_lookup import nested_lookup
+from parsel import Selector
+
+from thread_parser import post_fields, scrape_thread_page, find_thread_items
+
+FIXTURE_GLOB = "data/fixtures/*.html"
+REPEAT = 20
+
+LEGACY_EXPRESSION = """{
+    text: post.caption.text,
+    published_on: post.taken_at,
+    id: post.id,
+    code: post.code,
+    username: post.user.username,
+    like_count: post.like_count,
+    reply_count: view_replies_cta_string,
+    image_count: post.carousel_media_count,
+    videos: post.video_versions[].url
+}"""
+
+
+def synthetic_page(n_items=200, n_spans=2000):
+    """A post page shaped like the real one: one data-sjs blob with n_items thread items plus n_spans spans."""
+    items = [{
+        "post": {
+            "id": f"{3700000000000000000 + i}_{60000000000 + i}",
+            "code": f"C{i:010d}",
+            "taken_at": 1762000000 + i,
+            "caption": {"text": f"reply number {i} feeling sad today"},
+            "user": {"username": f"user{i}"},
+            "like_count": i,
+            "text_post_app_info": {"repost_count": i % 7},
+        },
+        "view_replies_cta_string": f"{i % 5} replies",
+    } for i in range(n_items)]
+    payload = {"require": [["ScheduledServerJS", "handle", None, [{"__bbox": {"require": [[
+        "RelayPrefetchedStreamCache", "next", [], ["adp", {"__bbox": {"result": {"data": {"data": {
+            "containing_thread": {"thread_items": items[:1]},
+            "reply_threads": [{"thread_items": [t]} for t in items[1:]],
+        }}}}}]]]}}]]]}
+    spans = "".join(f"<span>{i} likes</span>" for i in range(n_spans))
+    return (f'<html><body>{spans}'
+            f'<script type="application/json" data-sjs>{json.dumps(payload)}</script>'
+            f'</body></html>')
+
+
+def legacy_scrape_thread_page(page_source):
+    """The original parser: nested_lookup, per-item jmespath.search and a span scan per post."""
+    selector = Selector(text=page_source)
+    posts, seen_ids = [], set()
+    for raw in selector.css('script[type="application/json"][data-sjs]::text').getall():
+        if '"ScheduledServerJS"' not in raw or "thread_items" not in raw:
+            continue
+        data = json.loads(raw)
+        for group in nested_lookup("thread_items", data):
+            for t in group:
+                parsed = jmespath.search(LEGACY_EXPRESSION, t)
+                pid = str(parsed.get("id"))
+                if pid in seen_ids:
+                    continue
+                seen_ids.add(pid)
+                for txt in selector.css("span::text").getall():
+                    if "repost" in txt.lower():
+                        break
+                posts.append(parsed)
+    return posts
+
+
+def time_per_page(fn, pages, repeat=REPEAT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            fn(html)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(pages))
+
+
+def extract_only(pages):
+    """Decoded blobs, so thread_items extraction can be timed without HTML/JSON parsing."""
+    blobs = []
+    for html in pages:
+        for raw in Selector(text=html).css('script[type="application/json"][data-sjs]::text').getall():
+            if "thread_items" in raw:
+                blobs.append(json.loads(raw))
+    return blobs
+
+
+def main():
+    paths = sys.argv[1:] or glob(FIXTURE_GLOB)
+    if paths:
+        pages = [open(p, encoding="utf-8").read() for p in paths]
+        print(f"{len(pages)} fixture pages")
+    else:
+        pages = [synthetic_page()]
+        print("No fixtures found, using one synthetic page (200 items, 2000 spans)")
+
+    posts = sum(len(scrape_thread_page(html)) for html in pages)
+    print(f"posts/page: {posts / len(pages):.0f}")
+    before = time_per_page(legacy_scrape_thread_page, pages, max(1, REPEAT // 10))
+    after = time_per_page(scrape_thread_page, pages)
+    print(f"scrape_thread_page   before: {before:8.2f} ms/page   after: {after:8.2f} ms/page")
+
+    blobs = extract_only(pages)
+    if blobs:
+        legacy = lambda b: [jmespath.search(LEGACY_EXPRESSION, t) for g in nested_lookup("thread_items", b) for t in g]
+        current = lambda b: [post_fields(t) for g in find_thread_items(b) for t in g]
+        before = time_per_page(legacy, blobs)
+        after = time_per_page(current, blobs)
+        print(f"thread_items extract before: {before:7.2f} ms/blob   after: {after:7.2f} ms/blob")
+
+if __name__ == "__main__":
+    main()
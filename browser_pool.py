@@ -0,0 +1,111 @@
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+VIEWPORT = {"width": 1920, "height": 1080}
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}  # we only read the JSON in the HTML
+RECYCLE_AFTER = 300  # navigations before a context is replaced, to keep memory bounded
+
+
+def block_heavy(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        route.abort()
+    else:
+        route.continue_()
+
+
+async def block_heavy_async(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+def context_options(locale, accept):
+    return dict(
+        locale=locale,
+        extra_http_headers={"Accept-Language": accept},
+        viewport=VIEWPORT,
+        user_agent=USER_AGENT,
+    )
+
+
+class PooledContext:
+    """A browser context with one tag page and one post page that are navigated, not recreated."""
+
+    def __init__(self, browser, locale, accept, block_resources=True, reuse_pages=True, on_context=None):
+        self.locale, self.accept, self.reuse_pages = locale, accept, reuse_pages
+        self.context = browser.new_context(**context_options(locale, accept))
+        if block_resources:
+            self.context.route("**/*", block_heavy)
+        if on_context is not None:
+            on_context(self.context)
+        self.navigations = 0
+        self._tag_page = self._post_page = None
+
+    def _page(self, page):
+        if page is None or page.is_closed():
+            page = self.context.new_page()
+        return page
+
+    def tag_page(self):
+        self.navigations += 1
+        self._tag_page = self._page(self._tag_page)
+        return self._tag_page
+
+    def post_page(self):
+        """Reusable post page, or None to have the caller open a fresh one per post."""
+        self.navigations += 1
+        if not self.reuse_pages:
+            return None
+        self._post_page = self._page(self._post_page)
+        return self._post_page
+
+    def close(self):
+        self.context.close()
+
+
+class ContextPool:
+    """One long-lived context per locale, replaced after `recycle_after` navigations.
+
+    With reuse=False every `get` returns a fresh context and posts get a
+    fresh page each, which is the old behaviour, kept for comparison runs.
+    `on_context(context)` runs on every new context, after the blocking route.
+    """
+
+    def __init__(self, browser, reuse=True, recycle_after=RECYCLE_AFTER, block_resources=True, on_context=None):
+        self.browser, self.reuse = browser, reuse
+        self.recycle_after, self.block_resources = recycle_after, block_resources
+        self.on_context = on_context
+        self._contexts = {}
+        self._retired = set()
+        self.recycled = 0
+
+    def get(self, locale, accept):
+        """Context for `locale`; call at pair boundaries, since recycling closes its pages."""
+        pooled = self._contexts.get(locale)
+        if pooled is not None and (not self.reuse or pooled.navigations >= self.recycle_after
+                                   or locale in self._retired):
+            pooled.close()
+            self.recycled += 1
+            pooled = None
+        self._retired.discard(locale)
+        if pooled is None:
+            pooled = PooledContext(self.browser, locale, accept, self.block_resources, self.reuse, self.on_context)
+            self._contexts[locale] = pooled
+        return pooled
+
+    def retire(self, locale):
+        """Replace `locale`'s context (and its cookies) at its next `get`, e.g. after repeated failures."""
+        self._retired.add(locale)
+
+    def close(self):
+        for pooled in self._contexts.values():
+            pooled.close()
+        self._contexts.clear()
+
+
+def latency_summary(samples_ms):
+    """One-line count/mean/p50/p95 of per-post latencies."""
+    if not samples_ms:
+        return "n=0"
+    xs = sorted(samples_ms)
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return f"n={len(xs)} mean={sum(xs) / len(xs):.0f}ms p50={pick(0.5):.0f}ms p95={pick(0.95):.0f}ms"
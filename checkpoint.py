@@ -0,0 +1,113 @@
+import json, os
+from glob import glob
+
+CHECKPOINT_NAME = "autoscrape_checkpoint.json"
+WAL_NAME = "autoscrape_wal.jsonl"
+
+
+def pair_key(emotion, keyword, locale):
+    return f"{emotion}|{keyword}|{locale}"
+
+
+def _fresh_state():
+    return {
+        "total": 0,
+        "by_emotion": {},    # emotion -> posts accepted this run, for the scheduler's balance
+        "done": [],          # pair keys exhausted for this run (feed end, no new posts, goto failed)
+        "current": None,     # pair being crawled
+        "got_kw": 0,         # posts accepted in the current visit of `current`
+        "queued": [],        # post URLs harvested for `current` but not fetched yet
+        "seen_code": [],     # post codes already handled for `current`
+    }
+
+
+class Checkpoint:
+    """Crawl frontier plus a write-ahead log of accepted rows, kept under the save dir.
+
+    The frontier is rewritten atomically (temp file + rename) after every
+    change. Every accepted row is appended to the WAL before it is counted,
+    and the WAL is cleared once those rows are durable in a shard, so a
+    restart can replay exactly the rows that never reached disk.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, CHECKPOINT_NAME)
+        self.wal_path = os.path.join(root, WAL_NAME)
+        self.state = _fresh_state()
+        self.resumed = os.path.exists(self.path)
+        if self.resumed:
+            with open(self.path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def pending_rows(self):
+        """Rows logged since the last durable shard write; a torn last line is dropped."""
+        rows = []
+        with open(self.wal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    break
+        return rows
+
+    def log_row(self, row):
+        self._wal.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+    def rows_saved(self):
+        self._wal.seek(0)
+        self._wal.truncate()
+        self._wal.flush()
+
+    def is_done(self, key):
+        return key in self.state["done"]
+
+    def resume_pair(self, key):
+        """(seen codes, got_kw, queued URLs) to continue `key` with; empty unless it was interrupted."""
+        s = self.state
+        if s["current"] != key:
+            s.update(current=key, got_kw=0, queued=[], seen_code=[])
+            self.save()
+        return set(s["seen_code"]), s["got_kw"], list(s["queued"])
+
+    def update_pair(self, key, got_kw, queued, seen_code, total):
+        self.state.update(got_kw=got_kw, queued=list(queued), seen_code=list(seen_code), total=total)
+        self.save()
+
+    def finish_pair(self, key, exhausted=False):
+        """End the visit to `key`; exhausted pairs are not scheduled again this run."""
+        s = self.state
+        if exhausted and key not in s["done"]:
+            s["done"].append(key)
+        s.update(current=None, got_kw=0, queued=[], seen_code=[])
+        self.save()
+
+    def clear(self):
+        """Run finished: drop the checkpoint so the next run starts fresh."""
+        self._wal.close()
+        for path in (self.path, self.wal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        self._wal.close()
+
+
+def remove_partial_shards(root, pattern="*"):
+    """Delete unfinished shard files left by a crash; their rows are still in the WAL.
+
+    `pattern` narrows this to one writer's shards when several share `root`.
+    """
+    for path in glob(os.path.join(root, pattern + ".part")):
+        os.remove(path)
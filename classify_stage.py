@@ -0,0 +1,119 @@
+import threading, queue
+from collections import deque
+from metrics import METRICS
+from lang_detect import tag_languages
+
+MAX_PENDING_GROUPS = 4  # row groups waiting for the stage worker before the crawl blocks
+CLASSIFY_BATCH = 64
+
+
+class RowStage:
+    """Background processing of accepted row groups before they are saved.
+
+    The crawl loop hands each row group to `submit`, which returns at once
+    unless MAX_PENDING_GROUPS groups are already waiting (backpressure). A
+    worker thread runs `process` on each group; `ready` hands finished
+    groups back to the crawl thread, which saves them, so shards, the
+    checkpoint and the id index are only ever touched from one thread.
+    `close` drains everything.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_GROUPS):
+        self.inbox = queue.Queue(maxsize=max_pending)
+        self.done = deque()
+        self.pending = []  # groups submitted and not yet returned by `ready`; crawl thread only
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, rows):
+        if not rows:
+            return
+        self.pending.append(rows)
+        with METRICS.time("stage_wait"):
+            self.inbox.put(rows)
+
+    def pending_rows(self):
+        """Rows handed to the stage but not yet saved, for re-logging to the checkpoint."""
+        return [r for rows in self.pending for r in rows]
+
+    def ready(self):
+        """(kept, rejected) row lists for every group finished so far."""
+        kept, rejected = [], []
+        while self.done:
+            rows, keep, drop = self.done.popleft()
+            self.pending = [g for g in self.pending if g is not rows]
+            kept += keep
+            rejected += drop
+        return kept, rejected
+
+    def close(self):
+        """Wait for every submitted group, then stop the worker; returns `ready()`."""
+        self.inbox.put(None)
+        self.thread.join()
+        return self.ready()
+
+    def process(self, rows):
+        """(kept, rejected) for one group; runs on the worker thread."""
+        with METRICS.time("lang_detect"):
+            tag_languages(rows)
+        return rows, []
+
+    def _loop(self):
+        while True:
+            rows = self.inbox.get()
+            if rows is None:
+                return
+            try:
+                keep, drop = self.process(rows)
+            except Exception as e:  # never lose rows to a processing error; save them as they are
+                print(f"⚠️ Processing failed for {len(rows)} rows: {e}")
+                keep, drop = rows, []
+            self.done.append((rows, keep, drop))
+
+
+class ClassifyStage(RowStage):
+    """RowStage that also classifies each group with the trained model.
+
+    Besides lang_detect, the worker adds pred_emotion, p_<label> and
+    model_agrees columns. With `filter_disagreeing`, rows whose prediction
+    differs from their keyword emotion are split off as rejected; rows left
+    without English text are kept unscored.
+    """
+
+    def __init__(self, model_dir, backend="torch", threads=1, filter_disagreeing=False,
+                 max_pending=MAX_PENDING_GROUPS, batch_size=CLASSIFY_BATCH):
+        from predict import Predictor  # torch and transformers only when the stage is on
+
+        self.predictor = Predictor(model_dir, threads, batch_size, backend)
+        self.filter_disagreeing = filter_disagreeing
+        self.classified = self.rejected = 0
+        super().__init__(max_pending)
+
+    def _classify(self, rows):
+        from predict import score_columns
+
+        with METRICS.time("classify"):
+            columns = score_columns(self.predictor, [r.get("text") for r in rows])
+        keep, drop = [], []
+        for i, r in enumerate(rows):
+            for name, values in columns.items():
+                r[name] = values[i]
+            r["model_agrees"] = None if r["pred_emotion"] is None else r["pred_emotion"] == r.get("emotion")
+            (drop if self.filter_disagreeing and r["model_agrees"] is False else keep).append(r)
+        return keep, drop
+
+    def process(self, rows):
+        super().process(rows)
+        try:
+            keep, drop = self._classify(rows)
+        except Exception as e:  # never lose rows to a model error; save them unscored
+            from predict import SCORE_COLUMNS
+
+            print(f"⚠️ Classification failed for {len(rows)} rows: {e}")
+            # Same columns as scored rows, or a shard whose first group failed would drop them for good.
+            for r in rows:
+                r.update(dict.fromkeys(SCORE_COLUMNS + ["model_agrees"]))
+            keep, drop = rows, []
+        self.classified += len(rows)
+        self.rejected += len(drop)
+        return keep, drop
@@ -0,0 +1,179 @@
+"""One entry point for the scrapers and tools: python cli.py <command> [options].
+
+Only the modules a command needs are imported, so `stats` and `prep` start
+without torch, transformers or playwright. Module constants (TARGET_TOTAL,
+SHARD_SIZE, SAD/NEUTRAL/HAPPY, ...) can be overridden from a JSON or TOML
+file given with --config, where top-level keys apply to every command and
+a table named after a command applies to that command only, and with
+--set NAME=VALUE, VALUE being JSON or a plain string.
+"""
+import argparse, json, os, sqlite3, sys
+from glob import glob
+from importlib import import_module
+
+STATS_ROOTS = ("data/file/", "data/english/", "data/english/prepared/")
+EMOTION_LISTS = {"sad": "SAD", "neutral": "NEUTRAL", "happy": "HAPPY"}
+
+# Modules each command configures, in import order; passthrough commands hand
+# their remaining arguments to the module's own main().
+COMMANDS = {
+    "scrape": ["threads_autoscraper"],
+    "scrape-en": ["enThreadParser"],
+    "prep": ["dataPrepEDA"],
+    "train": ["modelTrain", "token_cache"],
+    "predict": ["predict"],
+    "export": ["export_model", "predict"],
+    "bench": ["bench"],
+    "stats": [],
+}
+PASSTHROUGH = {"prep": "dataPrepEDA", "train": "modelTrain", "predict": "predict", "export": "export_model",
+               "bench": "bench"}
+
+
+def load_config(path):
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_set(items):
+    values = {}
+    for item in items:
+        name, sep, raw = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects NAME=VALUE, got {item!r}")
+        try:
+            values[name.strip()] = json.loads(raw)
+        except ValueError:
+            values[name.strip()] = raw
+    return values
+
+
+def configure(modules, values):
+    """Set each UPPER_CASE override on every module that defines it; keyword lists rebuild ALL_KEYWORDS."""
+    unknown = [name for name in values if not any(hasattr(m, name) for m in modules)]
+    if unknown:
+        raise SystemExit(f"Unknown setting(s) for this command: {', '.join(sorted(unknown))}")
+    for module in modules:
+        for name, value in values.items():
+            if hasattr(module, name):
+                setattr(module, name, value)
+        # Only the module defining the lists rebuilds; ALL_KEYWORDS changes in place,
+        # so modules that imported it (threads_async_scraper) share the new one.
+        if any(name in values for name in EMOTION_LISTS.values()) and hasattr(module, "ALL_KEYWORDS") \
+                and all(hasattr(module, attr) for attr in EMOTION_LISTS.values()):
+            module.ALL_KEYWORDS[:] = [(emotion, k) for emotion, attr in EMOTION_LISTS.items()
+                                      for k in getattr(module, attr)]
+            if hasattr(module, "KEYWORD_MATCHER"):
+                module.KEYWORD_MATCHER = type(module.KEYWORD_MATCHER)(module.ALL_KEYWORDS)
+
+
+def stats(roots=STATS_ROOTS):
+    """Seen-id and shard counts per save dir, plus the prepared-data manifest; sqlite and json only."""
+    for root in roots:
+        index = os.path.join(root, "seen_ids.sqlite")
+        shards = [f for f in glob(os.path.join(root, "threads_*")) if f.endswith((".csv", ".parquet"))]
+        if not os.path.exists(index) and not shards:
+            continue
+        size = sum(os.path.getsize(f) for f in shards) / 2**20
+        print(f"{root}: {len(shards)} shards ({size:.1f} MB)")
+        if os.path.exists(index):
+            db = sqlite3.connect(f"file:{index}?mode=ro", uri=True)
+            scopes = db.execute("SELECT scope, COUNT(*) FROM seen GROUP BY scope ORDER BY COUNT(*) DESC").fetchall()
+            db.close()
+            print(f"  {sum(n for _, n in scopes)} seen ids"
+                  + (f" in {len(scopes)} scopes, top: " + ", ".join(f"{s}={n}" for s, n in scopes[:5])
+                     if len(scopes) > 1 else ""))
+        else:
+            print("  no id index yet (built on the next run)")
+        manifest = os.path.join(root, "manifest.json")
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                m = json.load(f)
+            print(f"  {m['batches']} prep batches from {len(m['files'])} source files")
+            for split, labels in m["labels"].items():
+                print(f"  {split}: {sum(labels.values())} rows, labels {dict(sorted(labels.items()))}")
+        near = os.path.join(root, "near_dup.sqlite")
+        if os.path.exists(near):
+            db = sqlite3.connect(f"file:{near}?mode=ro", uri=True)
+            (kept,) = db.execute("SELECT COUNT(*) FROM sig").fetchone()
+            db.close()
+            print(f"  {kept} texts in the near-duplicate index")
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description="Threads emotion scraper and model tools.",
+                                 epilog="prep, train, predict, export and bench take their own options too; "
+                                        "see `cli.py <command> --help`.")
+    ap.add_argument("--config", help="JSON or TOML file of settings")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override one setting")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("scrape", help="multi-locale autoscrape (threads_autoscraper)")
+    s.add_argument("--async", dest="use_async", action="store_true", help="use the asyncio scraper")
+    s.add_argument("--target-total", type=int)
+    s.add_argument("--per-keyword", type=int, dest="per_keyword_limit")
+    s.add_argument("--shard-size", type=int)
+    s.add_argument("--out", dest="root_save_dir")
+    s.add_argument("--format", dest="output_format", choices=("parquet", "csv"))
+    s.add_argument("--keywords", help="JSON or TOML file with sad/neutral/happy keyword lists")
+
+    e = sub.add_parser("scrape-en", help="English per-keyword scrape (enThreadParser)")
+    e.add_argument("--limit", type=int, dest="limit_per_keyword")
+    e.add_argument("--out", dest="root_save_dir")
+    e.add_argument("--format", dest="output_format", choices=("parquet", "csv"))
+    e.add_argument("--keywords", help="JSON or TOML file with sad/neutral/happy keyword lists")
+
+    for name, help_ in (("prep", "clean new shards into train/test partitions"),
+                        ("train", "fine-tune the classifier"),
+                        ("predict", "classify examples, score shards, or serve over HTTP"),
+                        ("export", "int8/ONNX export and backend report"),
+                        ("bench", "offline parser and pipeline benchmarks")):
+        sub.add_parser(name, help=help_, add_help=False)
+    t = sub.add_parser("stats", help="seen-id, shard and prepared-data counts")
+    t.add_argument("roots", nargs="*", default=list(STATS_ROOTS))
+    return ap
+
+
+def main(argv=None):
+    ap = build_parser()
+    args, rest = ap.parse_known_args(argv)
+    if rest and args.command not in PASSTHROUGH:
+        ap.error(f"unrecognized arguments: {' '.join(rest)}")
+
+    if args.command == "stats":
+        return stats(args.roots)
+
+    settings = load_config(args.config) if args.config else {}
+    values = {k: v for k, v in settings.items() if not isinstance(v, dict)}
+    values.update(settings.get(args.command, {}))
+    if getattr(args, "keywords", None):
+        lists = load_config(args.keywords)
+        values.update({attr: lists[emotion] for emotion, attr in EMOTION_LISTS.items() if emotion in lists})
+    for flag in ("target_total", "per_keyword_limit", "shard_size", "root_save_dir", "output_format",
+                 "limit_per_keyword"):
+        if getattr(args, flag, None) is not None:
+            values[flag.upper()] = getattr(args, flag)
+    values.update(parse_set(args.set))
+
+    names = COMMANDS[args.command] + (["threads_async_scraper"] if getattr(args, "use_async", False) else [])
+    modules = [import_module(name) for name in names]
+    configure(modules, values)
+
+    if args.command == "scrape":
+        if args.use_async:
+            import asyncio
+            asyncio.run(modules[-1].run_autoscrape_async())
+        else:
+            modules[0].run_autoscrape()
+    elif args.command == "scrape-en":
+        modules[0].scrape_english_data()
+    else:
+        import_module(PASSTHROUGH[args.command]).main(rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
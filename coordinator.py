@@ -0,0 +1,299 @@
+import argparse, ipaddress, os, socket, threading, time
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+
+import threads_autoscraper as scraper
+from id_index import open_id_index
+from checkpoint import pair_key
+from scheduler import PairScheduler
+
+DEFAULT_PORT = 50505
+DEFAULT_AUTHKEY = "threads"  # only accepted while the coordinator listens on loopback
+PROGRESS_EVERY = 30  # seconds between progress lines on the coordinator
+PAIR_POLL = 5.0      # seconds a worker waits for in-flight pairs before the scheduler is asked again
+
+
+class SharedIds:
+    """The coordinator's seen-id index, claimed and committed by every worker.
+
+    The manager serves each worker connection on its own thread, so all
+    access to the SQLite index goes through one lock. `add` is the claim:
+    the first worker to add an id owns the post. Uncommitted claims are
+    remembered per worker, so `release` can hand back the claims of a worker
+    that stopped or restarted before saving its rows.
+    """
+
+    def __init__(self, index):
+        self.index, self.lock = index, threading.Lock()
+        self.claimed = 0
+        self.owners = {}  # worker -> ids claimed but not yet committed
+
+    def __contains__(self, pid):
+        with self.lock:
+            return pid in self.index
+
+    def __len__(self):
+        with self.lock:
+            return len(self.index)
+
+    def add(self, pid, worker=None):
+        with self.lock:
+            if not self.index.add(pid):
+                return False
+            self.claimed += 1
+            self.owners.setdefault(worker, set()).add(str(pid))
+            return True
+
+    def commit(self, ids, worker=None):
+        with self.lock:
+            self.index.commit(ids)
+            self.owners.get(worker, set()).difference_update(str(i) for i in ids)
+
+    def release(self, worker):
+        """Forget `worker`'s uncommitted claims; its checkpoint replays and claims them again."""
+        with self.lock:
+            ids = self.owners.pop(worker, set())
+            self.index.release(ids)
+            self.claimed -= len(ids)
+            return len(ids)
+
+    def close(self):
+        with self.lock:
+            self.index.close()
+
+
+class WorkQueue:
+    """PairScheduler shared by all workers, plus the merged progress view.
+
+    A pair is handed to one worker at a time. Emotion balance uses the
+    posts reported by all workers, and no more pairs are handed out once
+    the workers together have claimed TARGET_TOTAL posts.
+    """
+
+    def __init__(self, scheduler, ids, target_total):
+        self.scheduler, self.ids, self.target_total = scheduler, ids, target_total
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # notified when a pair comes back or a worker leaves
+        self.in_flight, self.by_emotion, self.workers = {}, {}, {}
+
+    def hello(self, worker):
+        released = self.ids.release(worker)  # left over if this worker crashed without saying bye
+        if released:
+            print(f"{worker} reconnected; released {released} unsaved claims for its checkpoint to replay")
+        with self.lock:
+            self.workers.setdefault(worker, {"visits": 0, "posts": 0, "done": False})
+            self.workers[worker]["done"] = False
+
+    def bye(self, worker):
+        self.ids.release(worker)
+        with self.lock:
+            self.workers[worker]["done"] = True
+            for key, owner in list(self.in_flight.items()):
+                if owner == worker:
+                    del self.in_flight[key]
+            self.changed.notify_all()
+
+    def next_pair(self, by_emotion=None, worker=None):
+        """Next pair for `worker`; the worker's own `by_emotion` is ignored in favour of the global counts.
+
+        While other workers' pairs are in flight and may come back live, this
+        waits for them rather than returning None, which ends the worker.
+        """
+        with self.changed:
+            while True:
+                if self.ids.claimed >= self.target_total:
+                    return None
+                pair = self.scheduler.next_pair(self.by_emotion, exclude=set(self.in_flight))
+                if pair is not None:
+                    self.in_flight[pair_key(*pair[:3])] = worker
+                    return pair
+                if all(owner == worker for owner in self.in_flight.values()):
+                    return None
+                self.changed.wait(PAIR_POLL)
+
+    def record(self, key, new_posts, page_loads, seconds, exhausted=False, worker=None):
+        with self.lock:
+            self.in_flight.pop(key, None)
+            self.scheduler.record(key, new_posts, page_loads, seconds, exhausted)
+            emotion = key.split("|", 1)[0]
+            self.by_emotion[emotion] = self.by_emotion.get(emotion, 0) + new_posts
+            if worker in self.workers:
+                self.workers[worker]["visits"] += 1
+                self.workers[worker]["posts"] += new_posts
+            self.changed.notify_all()
+
+    def drop(self, key):
+        with self.lock:
+            self.in_flight.pop(key, None)
+            self.scheduler.drop(key)
+            self.changed.notify_all()
+
+    def summary(self):
+        with self.lock:
+            return self.scheduler.summary()
+
+    def finished(self):
+        """True once every worker that said hello has said bye and nothing is in flight."""
+        with self.lock:
+            return bool(self.workers) and not self.in_flight and all(w["done"] for w in self.workers.values())
+
+    def progress(self):
+        with self.lock:
+            return {
+                "claimed": self.ids.claimed,
+                "target": self.target_total,
+                "by_emotion": dict(self.by_emotion),
+                "in_flight": len(self.in_flight),
+                "workers": {w: dict(s) for w, s in self.workers.items()},
+            }
+
+
+class WorkerScheduler:
+    """What run_autoscrape sees as its scheduler: the shared queue, tagged with this worker's name."""
+
+    def __init__(self, queue, worker):
+        self.queue, self.worker = queue, worker
+
+    def next_pair(self, by_emotion, exclude=()):
+        return self.queue.next_pair(by_emotion, self.worker)
+
+    def record(self, key, new_posts, page_loads, seconds, exhausted=False):
+        self.queue.record(key, new_posts, page_loads, seconds, exhausted, self.worker)
+
+    def drop(self, key):
+        self.queue.drop(key)
+
+    def summary(self):
+        return self.queue.summary()
+
+
+class WorkerIds:
+    """What run_autoscrape sees as its id index: the shared one, with claims and commits tagged with this worker."""
+
+    def __init__(self, ids, worker):
+        self.ids, self.worker = ids, worker
+
+    def __contains__(self, pid):
+        return self.ids.__contains__(pid)
+
+    def __len__(self):
+        return self.ids.__len__()
+
+    def add(self, pid):
+        return self.ids.add(pid, self.worker)
+
+    def commit(self, ids):
+        self.ids.commit(ids, self.worker)
+
+
+class CoordinatorManager(BaseManager):
+    pass
+
+
+IDS_METHODS = ("__contains__", "__len__", "add", "commit")
+WORK_METHODS = ("hello", "bye", "next_pair", "record", "drop", "summary", "finished", "progress")
+CoordinatorManager.register("ids", exposed=IDS_METHODS)
+CoordinatorManager.register("work", exposed=WORK_METHODS)
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port or DEFAULT_PORT)
+
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def print_progress(p, final=False):
+    print(f"{'Final' if final else 'Progress'}: {p['claimed']}/{p['target']} posts claimed, "
+          f"{p['in_flight']} pairs in flight, by emotion {p['by_emotion']}")
+    if final:
+        for worker, s in sorted(p["workers"].items()):
+            print(f"  {worker}: {s['posts']} posts in {s['visits']} visits")
+
+
+def run_worker(address, authkey, worker):
+    """Connect to the coordinator at `address` and crawl pairs it hands out until it has none left."""
+    manager = CoordinatorManager(address=parse_address(address), authkey=authkey)
+    manager.connect()
+    queue = manager.work()
+    queue.hello(worker)
+    try:
+        scraper.run_autoscrape(WorkerScheduler(queue, worker), WorkerIds(manager.ids(), worker), worker)
+    finally:
+        queue.bye(worker)
+
+
+def serve(address, authkey, local_workers=0):
+    """Run the coordinator; with local_workers > 0 also start that many worker processes on this host."""
+    os.makedirs(scraper.ROOT_SAVE_DIR, exist_ok=True)
+    index = open_id_index(scraper.ROOT_SAVE_DIR, f"{scraper.ROOT_SAVE_DIR}/threads_*", check_same_thread=False)
+    ids = SharedIds(index)
+    scheduler = PairScheduler(scraper.ALL_KEYWORDS, scraper.LOCALES, scraper.ROOT_SAVE_DIR,
+                              scraper.TARGET_TOTAL, scraper.EMOTION_SHARES)
+    work = WorkQueue(scheduler, ids, scraper.TARGET_TOTAL)
+    CoordinatorManager.register("ids", callable=lambda: ids, exposed=IDS_METHODS)
+    CoordinatorManager.register("work", callable=lambda: work, exposed=WORK_METHODS)
+
+    server = CoordinatorManager(address=parse_address(address), authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Coordinator listening on {address} with {len(ids)} known IDs")
+
+    host = socket.gethostname()
+    procs = [Process(target=run_worker, args=(address, authkey, f"{host}-{i}")) for i in range(local_workers)]
+    for proc in procs:
+        proc.start()
+
+    last = time.time()
+    try:
+        while True:
+            time.sleep(1)
+            if procs and not any(proc.is_alive() for proc in procs):
+                break
+            if work.finished():
+                break
+            if time.time() - last >= PROGRESS_EVERY:
+                print_progress(work.progress())
+                last = time.time()
+    except KeyboardInterrupt:
+        print("Interrupted; workers keep their checkpoints and can be restarted.")
+    finally:
+        for proc in procs:
+            proc.join(timeout=5)
+        print_progress(work.progress(), final=True)
+        for line in work.summary():
+            print(f"  {line}")
+        ids.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Split autoscrape work across processes and hosts.")
+    sub = ap.add_subparsers(dest="mode", required=True)
+    s = sub.add_parser("serve", help="coordinator; add --local-workers to also crawl on this host")
+    s.add_argument("--address", default=f"127.0.0.1:{DEFAULT_PORT}",
+                   help="listen address; anything but loopback needs --authkey or AUTOSCRAPE_AUTHKEY")
+    s.add_argument("--local-workers", type=int, default=0)
+    w = sub.add_parser("worker", help="crawl for a coordinator, possibly on another host")
+    w.add_argument("--address", default=f"127.0.0.1:{DEFAULT_PORT}")
+    w.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}",
+                   help="stable name, so a restarted worker resumes its checkpoint")
+    for p in (s, w):
+        p.add_argument("--authkey", default=os.environ.get("AUTOSCRAPE_AUTHKEY"))
+    args = ap.parse_args()
+
+    if args.mode == "serve" and not args.authkey and not is_loopback(parse_address(args.address)[0]):
+        # The manager unpickles whatever a client with the key sends, so the default key must stay local.
+        ap.error(f"refusing to listen on {args.address} without --authkey or AUTOSCRAPE_AUTHKEY")
+    authkey = (args.authkey or DEFAULT_AUTHKEY).encode()
+    if args.mode == "serve":
+        serve(args.address, authkey, args.local_workers)
+    else:
+        run_worker(args.address, authkey, args.name)
+
+
+if __name__ == "__main__":
+    main()
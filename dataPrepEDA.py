@@ -1,50 +1,218 @@
+import argparse, hashlib, json, os, time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
+from itertools import repeat
+from sinks import is_shard_file, iter_shard, open_sink, read_shard
+from id_index import open_id_index
+from text_clean import NearDupIndex, clean_and_sign
 
-# Load and merge CSVs
-files = glob("data/english/*.csv")
-
-dfs = []
-for f in files:
-    try:
-        temp = pd.read_csv(f)
-        if not temp.empty:
-            dfs.append(temp)
-        else:
-            print(f"⚠️ Skipping empty file: {f}")
-    except Exception as e:
-        print(f"⚠️ Could not read {f}: {e}")
-
-df = pd.concat(dfs, ignore_index=True)
-df.drop_duplicates(subset="id", inplace=True)
-print("✅ Loaded", len(dfs), "files → total posts:", len(df))
-
-# Clean text
-df = df.dropna(subset=["text"])
-df = df[df["text"].str.strip() != ""]
-
-df["text"] = df["text"].astype(str)
-df["text"] = df["text"].str.replace(r"http\S+", "", regex=True)
-df["text"] = df["text"].str.replace(r"@\w+", "", regex=True)
-df["text"] = df["text"].str.encode('ascii', 'ignore').str.decode('ascii')
-
-# Add label column
-df["label"] = df["emotion"].map({
-    "sad": 0,
-    "neutral": 1,
-    "happy": 2
-})
-
-print(df["label"].value_counts())
-
-# Save cleaned dataset
-df.to_csv("data/english/cleaned_dataset.csv", index=False)
-print("💾 Saved → data/english/cleaned_dataset.csv")
-
-# Split into train/test
-from sklearn.model_selection import train_test_split
-
-train, test = train_test_split(df, test_size=0.2, stratify=df["label"], random_state=42)
-train.to_csv("data/english/train.csv", index=False)
-test.to_csv("data/english/test.csv", index=False)
-print("✅ Train/Test split saved.")
+# Only the columns used below are read from each shard
+PREP_COLUMNS = ["id", "text", "keyword", "emotion"]
+SOURCE_GLOB = "data/english/threads_*"
+PREP_DIR = "data/english/prepared/"
+PREP_FORMAT = "csv"  # or "parquet"
+SPLITS = ("cleaned", "train", "test")
+MANIFEST_NAME = "manifest.json"
+CHUNK_ROWS = 50_000
+TEST_PERCENT = 20
+LABELS = {"sad": 0, "neutral": 1, "happy": 2}
+ASCII_ONLY = True  # strip non-ASCII characters; False keeps Russian and Kazakh text
+CLEAN_WORKERS = os.cpu_count() or 1
+CLEAN_BATCH = 5_000  # texts per process-pool task
+NEAR_DUP_NAME = "near_dup.sqlite"
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest():
+    path = os.path.join(PREP_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"batches": 0, "files": {}, "labels": {"train": {}, "test": {}}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    path = os.path.join(PREP_DIR, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def changed_files(manifest):
+    """(path, stat, sha1) of shards that are new or changed; an unchanged size and mtime skips hashing."""
+    for path in sorted(glob(SOURCE_GLOB)):
+        if not is_shard_file(path):
+            continue
+        st = os.stat(path)
+        seen = manifest["files"].get(path)
+        if seen and seen["size"] == st.st_size and seen["mtime"] == st.st_mtime:
+            continue
+        digest = file_sha1(path)
+        if seen and seen["sha1"] == digest:
+            seen["mtime"] = st.st_mtime  # touched, not changed
+            continue
+        yield path, st, digest
+
+
+def clean_chunk(df, pool, ascii_only=None):
+    """Cleaned rows with the numeric label, plus one MinHash signature per row.
+
+    URL/mention/non-ASCII removal and signing run on `pool` in CLEAN_BATCH
+    slices. Rows left without text after cleaning are dropped.
+    """
+    ascii_only = ASCII_ONLY if ascii_only is None else ascii_only
+    df = df.dropna(subset=["text"])
+    df = df[df["text"].astype(str).str.strip() != ""].copy()
+    df["id"] = df["id"].astype(str)
+    df["emotion"] = df["emotion"].astype(str)
+    texts = df["text"].astype(str).tolist()
+    batches = [texts[i:i + CLEAN_BATCH] for i in range(0, len(texts), CLEAN_BATCH)]
+    cleaned, signatures = [], []
+    for batch_cleaned, batch_signatures in pool.map(clean_and_sign, batches, repeat(ascii_only)):
+        cleaned += batch_cleaned
+        signatures.append(batch_signatures)
+    df["text"] = cleaned
+    df["label"] = df["emotion"].map(LABELS)
+    signatures = np.vstack(signatures) if signatures else np.empty((0, 0), np.uint64)
+    keep = (df["text"].str.strip() != "").to_numpy()
+    return df[keep], signatures[keep]
+
+
+def split_of(pid):
+    """"test" for a fixed TEST_PERCENT of ids by hash, so a row never changes split when data is added."""
+    bucket = int.from_bytes(hashlib.blake2b(pid.encode("utf-8"), digest_size=8).digest(), "big") % 100
+    return "test" if bucket < TEST_PERCENT else "train"
+
+
+def part_paths(split):
+    return sorted(f for f in glob(os.path.join(PREP_DIR, split, "part-*")) if is_shard_file(f))
+
+
+def load_split(split):
+    """All partitions of "cleaned", "train" or "test" as one DataFrame."""
+    parts = [read_shard(p) for p in part_paths(split)]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=PREP_COLUMNS + ["label"])
+
+
+def build(ascii_only=None, workers=None):
+    """Clean only new or changed shards and append them as one new partition per split.
+
+    Ids already in the cleaned output are skipped through a persistent id
+    index, so a changed shard only contributes its new rows; texts whose
+    MinHash puts them within NEAR_DUP_THRESHOLD of a kept text are dropped
+    too, whatever their id, so reposts cannot land in both splits. The partition,
+    the ids and then the manifest are committed only after every file is done;
+    a crash before the manifest is saved leaves a partition that the next
+    build deletes, along with its ids and signatures, and redoes.
+    """
+    # Module settings are read here rather than bound as defaults, so cli.py --set reaches them.
+    ascii_only = ASCII_ONLY if ascii_only is None else ascii_only
+    workers = workers or CLEAN_WORKERS
+    started = time.perf_counter()
+    for split in SPLITS:
+        os.makedirs(os.path.join(PREP_DIR, split), exist_ok=True)
+    manifest = load_manifest()
+    batch = manifest["batches"] + 1
+    seen = open_id_index(PREP_DIR, os.path.join(PREP_DIR, "cleaned", "part-*"))
+    near = NearDupIndex(os.path.join(PREP_DIR, NEAR_DUP_NAME))
+    for stale in glob(os.path.join(PREP_DIR, "*", f"part-{batch:05d}.*")):
+        if os.path.basename(os.path.dirname(stale)) == "cleaned" and is_shard_file(stale):
+            try:
+                ids = read_shard(stale, ["id"])["id"].dropna().astype(str).tolist()
+            except Exception:
+                ids = []  # cut off mid-write, so its ids were never committed
+            seen.forget(ids)
+            near.forget(ids)
+        os.remove(stale)
+
+    sinks = {split: open_sink(PREP_FORMAT, os.path.join(PREP_DIR, split, f"part-{batch:05d}"), media_ids=False)
+             for split in SPLITS}
+    new_ids, claimed, files, read_rows = [], [], 0, 0
+    exact_dups = near_dups = 0
+    clean_seconds = 0.0
+    labels = {"train": {}, "test": {}}
+    pool = ProcessPoolExecutor(workers)
+    for path, st, digest in changed_files(manifest):
+        rows = 0
+        try:
+            for chunk in iter_shard(path, PREP_COLUMNS, CHUNK_ROWS):
+                read_rows += len(chunk)
+                clean_started = time.perf_counter()
+                df, signatures = clean_chunk(chunk, pool, ascii_only)
+                clean_seconds += time.perf_counter() - clean_started
+                keep = []
+                for pid, signature in zip(df["id"], signatures):
+                    if not seen.add(pid):  # claims the id for this build
+                        exact_dups += 1
+                        keep.append(False)
+                        continue
+                    claimed.append(pid)
+                    if near.check_add(pid, signature) is not None:
+                        near_dups += 1
+                        keep.append(False)
+                        continue
+                    keep.append(True)
+                df = df[keep]
+                if df.empty:
+                    continue
+                split = df["id"].map(split_of)
+                sinks["cleaned"].write(df.to_dict("records"))
+                for name in ("train", "test"):
+                    part = df[split == name]
+                    if not part.empty:
+                        sinks[name].write(part.to_dict("records"))
+                        for label, n in part["label"].value_counts().items():
+                            labels[name][str(label)] = labels[name].get(str(label), 0) + int(n)
+                new_ids += df["id"].tolist()
+                rows += len(df)
+        except Exception as e:
+            print(f"⚠️ Could not read {path}: {e}")
+            continue
+        manifest["files"][path] = {"size": st.st_size, "mtime": st.st_mtime, "sha1": digest,
+                                   "batch": batch, "rows": rows}
+        files += 1
+
+    pool.shutdown()
+    for sink in sinks.values():
+        sink.close()
+    if new_ids:
+        manifest["batches"] = batch
+        for name, counts in labels.items():
+            for label, n in counts.items():
+                manifest["labels"][name][label] = manifest["labels"][name].get(label, 0) + n
+    seen.commit(claimed)  # near-duplicates too, so later builds skip them by id
+    near.commit()
+    save_manifest(manifest)  # last, so files are only marked done once their ids and signatures are saved
+    seen.close()
+    near.close()
+
+    print(f"✅ {files} new or changed files, {read_rows} rows read → {len(new_ids)} new posts "
+          f"in {time.perf_counter() - started:.1f}s")
+    if read_rows:
+        print(f"🧹 cleaning: {read_rows / max(clean_seconds, 1e-9):,.0f} rows/s on {workers} workers; "
+              f"removed {exact_dups} duplicate ids and {near_dups} near-duplicate texts")
+    if new_ids:
+        print(f"💾 Partition {batch:05d} → {PREP_DIR}{{cleaned,train,test}}/")
+    for name in ("train", "test"):
+        print(f"{name}: labels {dict(sorted(manifest['labels'][name].items()))}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Incrementally clean new shards into train/test partitions.")
+    ap.add_argument("--keep-non-ascii", action="store_true", help="keep Cyrillic and other non-ASCII text")
+    ap.add_argument("--workers", type=int, default=CLEAN_WORKERS)
+    args = ap.parse_args(argv)
+    build(ascii_only=False if args.keep_non_ascii else None, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
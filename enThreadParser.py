@@ -1,18 +1,22 @@
-import json, time, os, re
-from parsel import Selector
-from nested_lookup import nested_lookup
-import jmespath
+import time, os, re
 from playwright.sync_api import sync_playwright
-import pandas as pd
 from urllib.parse import quote
-from glob import glob
+from post_fetcher import make_http_client, fetch_post_html
+from thread_parser import scrape_thread_page
+from id_index import open_id_index
+from sinks import open_sink
+from browser_pool import ContextPool
+from replay import FixtureSession
+from fetch_policy import FetchGuard, classify
 
 
 ROOT_SAVE_DIR = "data/english/"
 LIMIT_PER_KEYWORD = 250
 SLEEP = 2
 LOCALE = ("en-US", "en-US,en;q=0.9")
-os.makedirs(ROOT_SAVE_DIR, exist_ok=True)
+OUTPUT_FORMAT = "parquet"  # or "csv"
+POST_FETCH_BACKEND = "http"  # "http": pooled HTTP first, browser fallback; "browser": always Chromium
+FIXTURE_MODE = None  # "record" or "replay", see replay.py
 
 
 SAD = [
@@ -35,98 +39,47 @@ ALL_KEYWORDS = [("sad", k) for k in SAD] + [("neutral", k) for k in NEUTRAL] + [
 
 
 
-def load_existing_ids(keyword):
-    """Avoid re-scraping posts that already exist."""
-    existing = set()
-    for file in glob(f"{ROOT_SAVE_DIR}/threads_{keyword}_*.csv"):
-        try:
-            df = pd.read_csv(file, usecols=["id"])
-            existing.update(df["id"].dropna().astype(str))
-        except Exception:
-            continue
-    return existing
-
-def parse_thread(data):
-    """Extract main post data from JSON."""
-    result = jmespath.search(
-        """{
-            text: post.caption.text,
-            published_on: post.taken_at,
-            id: post.id,
-            code: post.code,
-            username: post.user.username,
-            like_count: post.like_count,
-            reply_count: view_replies_cta_string,
-            image_count: post.carousel_media_count,
-            videos: post.video_versions[].url
-        }""",
-        data,
-    )
-    if not result:
-        return None
-    if result.get("reply_count") and not isinstance(result["reply_count"], int):
-        try:
-            first = str(result["reply_count"]).split(" ")[0]
-            result["reply_count"] = int(first) if first.isdigit() else 0
-        except Exception:
-            result["reply_count"] = 0
-    result["url"] = f"https://www.threads.net/@{result['username']}/post/{result['code']}"
-    result["repost_count"] = 0
-    return result
-
-def scrape_thread_page(page_source):
-    """Extract all posts from the Threads page source."""
-    selector = Selector(text=page_source)
-    datasets = selector.css('script[type="application/json"][data-sjs]::text').getall()
-    posts, seen_ids = [], set()
-
-    for raw in datasets:
-        if '"ScheduledServerJS"' not in raw or "thread_items" not in raw:
-            continue
-        try:
-            data = json.loads(raw)
-        except Exception:
-            continue
-        thread_items = nested_lookup("thread_items", data)
-        for group in thread_items:
-            for t in group:
-                parsed = parse_thread(t)
-                if not parsed:
-                    continue
-                pid = str(parsed.get("id"))
-                if pid in seen_ids:
-                    continue
-                seen_ids.add(pid)
-                posts.append(parsed)
-    return posts
-
-def save_results(keyword, posts):
-    """Save results as CSV."""
-    df = pd.DataFrame(posts)
-    fname = f"{ROOT_SAVE_DIR}/threads_{keyword}_en_{int(time.time())}.csv"
-    df.to_csv(fname, index=False)
-    print(f"💾 Saved {len(df)} posts → {fname}")
+def load_existing_ids():
+    """Seen-id index for ROOT_SAVE_DIR, scoped per keyword via `.scoped(keyword)`."""
+    return open_id_index(ROOT_SAVE_DIR, f"{ROOT_SAVE_DIR}/threads_*", scope_column="keyword")
+
+def save_results(keyword, posts, existing_ids=None):
+    """Save results as Parquet or CSV, per OUTPUT_FORMAT."""
+    if not posts:
+        print(f"No new posts for #{keyword}")
+        return
+    sink = open_sink(OUTPUT_FORMAT, f"{ROOT_SAVE_DIR}/threads_{keyword}_en_{int(time.time())}")
+    sink.write(posts)
+    sink.close()
+    if existing_ids is not None:
+        existing_ids.commit(p.get("id") for p in posts)
+    print(f"💾 Saved {len(posts)} posts → {sink.path}")
 
 
 def scrape_english_data():
+    os.makedirs(ROOT_SAVE_DIR, exist_ok=True)
     locale, accept = LOCALE
+    fixtures = FixtureSession(FIXTURE_MODE) if FIXTURE_MODE else None
+    http = make_http_client(fixtures.transport() if fixtures else None) if POST_FETCH_BACKEND == "http" else None
+    index = load_existing_ids()
     with sync_playwright() as pw:
         browser = pw.chromium.launch(headless=True)
-        context = browser.new_context(
-            locale=locale,
-            extra_http_headers={"Accept-Language": accept},
-            viewport={"width": 1920, "height": 1080},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-        )
+        pool = ContextPool(browser, on_context=fixtures.attach if fixtures else None)
+        # Replayed fixtures are local and deterministic: no pacing, no breaker, and a miss stays a miss.
+        if FIXTURE_MODE == "replay":
+            guard = FetchGuard(1e6, retries=0, breaker_threshold=float("inf"))
+        else:
+            guard = FetchGuard(on_trip=pool.retire)
 
         for emotion, keyword in ALL_KEYWORDS:
             results, seen_ids = [], set()
-            existing_ids = load_existing_ids(keyword)
+            existing_ids = index.scoped(keyword)
             encoded_keyword = quote(keyword)
             search_url = f"https://www.threads.net/tag/{encoded_keyword}"
             print(f"🌍 [{emotion}] → #{keyword}")
 
-            page = context.new_page()
+            pooled = pool.get(locale, accept)
+            page = pooled.tag_page()
             try:
                 page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
             except Exception as e:
@@ -148,11 +101,9 @@ def scrape_english_data():
                     seen_ids.add(post_code)
 
                     try:
-                        p2 = context.new_page()
-                        p2.goto(href, wait_until="domcontentloaded", timeout=20000)
-                        p2.wait_for_selector("[data-pressable-container=true]", timeout=8000)
-                        posts = scrape_thread_page(p2.content())
-                        p2.close()
+                        html = guard.fetch(locale, lambda: fetch_post_html(
+                            pooled.context, http, href, accept, page=pooled.post_page()), keyword)
+                        posts = scrape_thread_page(html)
                         for p in posts:
                             pid = str(p.get("id"))
                             if pid in existing_ids:
@@ -160,9 +111,10 @@ def scrape_english_data():
                             p["keyword"] = keyword
                             p["emotion"] = emotion
                             p["language_context"] = "english"
+                            existing_ids.add(pid)
                             results.append(p)
                     except Exception as e:
-                        print("⚠️ Post error:", e)
+                        print(f"⚠️ Post error ({classify(e)}):", e)
                     if len(results) >= LIMIT_PER_KEYWORD:
                         break
 
@@ -173,10 +125,16 @@ def scrape_english_data():
                     break
                 last_height = new_height
 
-            save_results(keyword, results)
-            page.close()
+            save_results(keyword, results, existing_ids)
 
+        pool.close()
         browser.close()
+    if http is not None:
+        http.close()
+    index.close()
+    print(f"Fetches: {guard.summary()}")
+    if fixtures:
+        print(f"Fixtures {fixtures.summary()}")
     print("✅ All English keywords scraped.")
 
 
@@ -0,0 +1,118 @@
+import argparse, json, os, time
+import torch
+from sklearn.metrics import f1_score
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from dataPrepEDA import load_split
+from predict import (BACKENDS, BATCH_SIZE, INT8_WEIGHTS, MAX_LENGTH, MODEL_DIR, ONNX_FILE, THREADS, Predictor,
+                     backend_dir, quantize_int8)
+
+ONNX_OPSET = 14
+F1_TOLERANCE = 0.01  # macro-F1 a variant may lose against fp32 and still be picked
+REPORT_ROWS = None   # limit the test rows timed in the report; None uses the whole split
+
+
+def dir_size_mb(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 2**20
+
+
+def export_int8(model_dir=MODEL_DIR):
+    """Dynamically quantized copy of the fp32 model: int8 Linear weights, saved as a state dict plus config."""
+    out = backend_dir(model_dir, "int8")
+    os.makedirs(out, exist_ok=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+    torch.save(quantize_int8(model).state_dict(), os.path.join(out, INT8_WEIGHTS))
+    model.config.save_pretrained(out)
+    AutoTokenizer.from_pretrained(model_dir).save_pretrained(out)
+    print(f"💾 int8 → {out} ({dir_size_mb(out):.0f} MB, fp32 {dir_size_mb(model_dir):.0f} MB)")
+
+
+def export_onnx(model_dir=MODEL_DIR, opset=ONNX_OPSET):
+    """ONNX graph of the fp32 model with dynamic batch and sequence axes."""
+    out = backend_dir(model_dir, "onnx")
+    os.makedirs(out, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+    model.config.return_dict = False
+    sample = tokenizer(["export sample"], truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+    dynamic = {0: "batch", 1: "sequence"}
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, (sample["input_ids"], sample["attention_mask"]), os.path.join(out, ONNX_FILE),
+            input_names=["input_ids", "attention_mask"], output_names=["logits"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+    model.config.save_pretrained(out)
+    tokenizer.save_pretrained(out)
+    print(f"💾 onnx → {out} ({dir_size_mb(out):.0f} MB)")
+
+
+def report(model_dir=MODEL_DIR, tolerance=F1_TOLERANCE, threads=THREADS, batch_size=BATCH_SIZE, rows=REPORT_ROWS):
+    """Macro-F1 and rows/sec of every exported backend on the test split.
+
+    The recommendation is the fastest backend whose macro-F1 is within
+    `tolerance` of the fp32 model's.
+    """
+    test_df = load_split("test").dropna(subset=["text", "label"])
+    if rows:
+        test_df = test_df.head(rows)
+    texts, labels = test_df["text"].astype(str).tolist(), test_df["label"].astype(int).to_numpy()
+    print(f"Test split: {len(texts)} rows, {threads} thread(s), batch {batch_size}")
+    results = []
+    for backend in BACKENDS:
+        try:
+            predictor = Predictor(model_dir, threads, batch_size, backend)
+        except (OSError, ImportError) as e:
+            print(f"{backend:6s} skipped: {e}")
+            continue
+        predictor.predict(texts[:batch_size])  # warm-up
+        start = time.perf_counter()
+        predicted = predictor.predict(texts).argmax(axis=1)
+        seconds = time.perf_counter() - start
+        results.append({
+            "backend": backend,
+            "macro_f1": float(f1_score(labels, predicted, average="macro")),
+            "rows_per_sec": len(texts) / seconds if seconds else 0.0,
+            "ms_per_row": seconds * 1000 / len(texts) if texts else 0.0,
+            "size_mb": dir_size_mb(backend_dir(model_dir, backend)),
+        })
+    baseline = next((r for r in results if r["backend"] == "torch"), None)
+    for r in results:
+        drop = baseline["macro_f1"] - r["macro_f1"] if baseline else 0.0
+        r["within_tolerance"] = drop <= tolerance
+        print(f"{r['backend']:6s} macro-F1 {r['macro_f1']:.4f} ({-drop:+.4f}) {r['rows_per_sec']:9.1f} rows/s "
+              f"{r['ms_per_row']:7.2f} ms/row {r['size_mb']:7.0f} MB{'' if r['within_tolerance'] else '  ✗ tolerance'}")
+    ok = [r for r in results if r["within_tolerance"]]
+    if ok:
+        best = max(ok, key=lambda r: r["rows_per_sec"])
+        print(f"✅ Fastest within {tolerance:.3f} macro-F1 of fp32: {best['backend']} "
+              f"(predict.py --backend {best['backend']})")
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export int8 and ONNX variants of the trained model and compare them.")
+    ap.add_argument("--model", default=MODEL_DIR)
+    sub = ap.add_subparsers(dest="command")
+    sub.add_parser("export", help="write the int8 and ONNX variants next to the model")
+    rp = sub.add_parser("report", help="accuracy vs latency of each backend on the test split")
+    rp.add_argument("--tolerance", type=float, default=F1_TOLERANCE)
+    rp.add_argument("--threads", type=int, default=THREADS)
+    rp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    rp.add_argument("--rows", type=int, default=REPORT_ROWS)
+    rp.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args(argv)
+
+    if args.command == "report":
+        results = report(args.model, args.tolerance, args.threads, args.batch_size, args.rows)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    else:
+        export_int8(args.model)
+        export_onnx(args.model)
+
+
+if __name__ == "__main__":
+    main()
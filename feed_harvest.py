@@ -0,0 +1,102 @@
+import json, random, time
+from thread_parser import find_thread_items, parse_thread, scrape_thread_page
+from metrics import METRICS, is_timeout
+
+FEED_WAIT_MS = (1500, 15000)  # bounds on how long a scroll waits for the feed response it triggers
+FEED_PAUSE = 0.5   # pause after a response, as a fraction of the recent response latency
+FEED_JITTER = 0.4  # plus up to this many seconds at random
+COMPLETE_FIELDS = ("id", "code", "text", "username")
+
+
+def is_feed_response(response):
+    return "/graphql" in response.url and response.request.method == "POST" and response.status == 200
+
+
+def posts_from_feed(body):
+    """Posts in one GraphQL response body; streamed responses carry one JSON document per line."""
+    body = body.removeprefix("for (;;);")
+    try:
+        docs = [json.loads(body)]
+    except ValueError:
+        docs = []
+        for line in body.splitlines():
+            try:
+                docs.append(json.loads(line))
+            except ValueError:
+                continue
+    return [p for doc in docs for group in find_thread_items(doc) for p in map(parse_thread, group) if p]
+
+
+def is_complete(post):
+    """Whether a feed item already has everything a post-page fetch would give for it."""
+    return all(post.get(f) for f in COMPLETE_FIELDS) and isinstance(post.get("like_count"), int) \
+        and isinstance(post.get("repost_count"), int)
+
+
+class FeedHarvester:
+    """Posts from the responses a tag page loads while scrolling, instead of polling its DOM for links.
+
+    Feed responses are buffered by a page listener and parsed on `harvest`,
+    along with the server-rendered first screen. Complete feed items are
+    returned as posts; only incomplete ones come back as URLs to fetch.
+    `scroll` waits for the response it triggers rather than a fixed sleep:
+    its timeout and the pause after it follow the recent response latency.
+    """
+
+    def __init__(self, page):
+        self.page, self.responses, self.latency = page, [], None
+        self.html = None
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if is_feed_response(response):
+            self.responses.append(response)
+
+    def first_screen(self):
+        self.html = self.page.content()
+
+    def harvest(self, seen_code, keyword="", locale=""):
+        """(complete posts, URLs of incomplete ones) not in `seen_code`, marking their codes as seen."""
+        posts = scrape_thread_page(self.html) if self.html else []
+        self.html = None
+        while self.responses:
+            try:
+                body = self.responses.pop(0).text()
+            except Exception:  # body already gone, e.g. the page navigated
+                continue
+            posts += posts_from_feed(body)
+        complete, hrefs = [], []
+        for p in posts:
+            code = p.get("code")
+            if not code or code in seen_code:
+                continue
+            seen_code.add(code)
+            if is_complete(p):
+                complete.append(p)
+            elif p.get("username"):
+                hrefs.append(p["url"])
+        if complete:
+            METRICS.count("feed_post", keyword, locale, len(complete))
+        return complete, hrefs
+
+    def scroll(self, distance, keyword="", locale=""):
+        """Scroll and wait for the next feed response; False if none arrived in time."""
+        low, high = FEED_WAIT_MS
+        timeout = min(high, max(low, 4000 * self.latency)) if self.latency else high
+        start = time.perf_counter()
+        try:
+            with METRICS.time("feed_wait"):
+                with self.page.expect_response(is_feed_response, timeout=timeout):
+                    self.page.mouse.wheel(0, distance)
+        except Exception as e:
+            if not is_timeout(e):
+                raise
+            METRICS.count("feed_timeout", keyword, locale)
+            return False
+        elapsed = time.perf_counter() - start
+        self.latency = elapsed if self.latency is None else 0.7 * self.latency + 0.3 * elapsed
+        time.sleep(FEED_PAUSE * self.latency + random.uniform(0, FEED_JITTER))
+        return True
+
+    def close(self):
+        self.page.remove_listener("response", self._on_response)
@@ -0,0 +1,160 @@
+import random, time
+from metrics import METRICS, is_timeout
+
+FETCH_RATE = 1.0         # post fetches per second per locale once warmed up
+FETCH_BURST = 3          # fetches allowed back to back before the rate applies
+MIN_RATE = 0.1           # floor the rate is halved down to on throttling
+RETRIES = 3              # extra attempts for retryable failures
+BACKOFF_BASE = 2.0       # seconds; attempt n waits a random 0..BACKOFF_BASE * 2**n
+BACKOFF_MAX = 60.0
+BREAKER_THRESHOLD = 5    # failures in a row that pause a locale's context
+BREAKER_COOLDOWN = 60.0  # first pause in seconds, doubled on every further trip
+BREAKER_COOLDOWN_MAX = 600.0
+RETRYABLE = {"timeout", "throttled", "server", "error"}  # login walls and empty pages do not improve on retry
+
+
+class FetchFailure(Exception):
+    """A classified fetch failure: "throttled" (429), "server" (5xx), "login" or "no_content"."""
+
+    def __init__(self, kind, message="", retry_after=None):
+        super().__init__(message or kind)
+        self.kind, self.retry_after = kind, retry_after
+
+
+def classify(exc):
+    if isinstance(exc, FetchFailure):
+        return exc.kind
+    return "timeout" if is_timeout(exc) else "error"
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header, or None (HTTP dates are ignored)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; the rate halves on throttling and creeps back on success."""
+
+    def __init__(self, rate=FETCH_RATE, burst=FETCH_BURST):
+        self.base = self.rate = rate
+        self.burst, self.tokens, self.last = burst, float(burst), time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def wait_time(self):
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def slow_down(self):
+        self.rate = max(MIN_RATE, self.rate / 2)
+
+    def speed_up(self):
+        self.rate = min(self.base, self.rate + self.base / 20)
+
+
+class CircuitBreaker:
+    """Opens for a cooldown after BREAKER_THRESHOLD failures in a row; each further trip doubles it."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold, self.base_cooldown = threshold, cooldown
+        self.cooldown, self.failures, self.open_until, self.trips = cooldown, 0, 0.0, 0
+
+    def wait_time(self):
+        return max(0.0, self.open_until - time.monotonic())
+
+    def success(self):
+        self.failures, self.cooldown = 0, self.base_cooldown
+
+    def failure(self):
+        """Cooldown in seconds if this failure opened the breaker, else 0."""
+        self.failures += 1
+        if self.failures < self.threshold:
+            return 0.0
+        cooldown = self.cooldown
+        self.open_until = time.monotonic() + cooldown
+        self.failures, self.trips = 0, self.trips + 1
+        self.cooldown = min(BREAKER_COOLDOWN_MAX, cooldown * 2)
+        return cooldown
+
+
+class FetchGuard:
+    """Rate limiting, retries and circuit breaking around post fetches, per locale.
+
+    `fetch(locale, fn)` waits for the locale's breaker and token bucket,
+    calls `fn`, and retries retryable failures with exponential backoff and
+    full jitter (at least Retry-After for 429s). The last failure is
+    re-raised. `on_trip(locale)` runs whenever a breaker opens, e.g. to
+    replace the context at the next pair. Each locale's breaker opens after
+    `breaker_threshold` failures in a row, first for `breaker_cooldown` seconds.
+    """
+
+    def __init__(self, rate=FETCH_RATE, burst=FETCH_BURST, retries=RETRIES, on_trip=None,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN):
+        self.rate, self.burst, self.retries = rate, burst, retries
+        self.breaker_threshold, self.breaker_cooldown = breaker_threshold, breaker_cooldown
+        self.on_trip = on_trip
+        self.buckets, self.breakers = {}, {}
+        self.stats = {"fetches": 0, "retries": 0, "failed": 0, "trips": 0,
+                      "throttle_s": 0.0, "backoff_s": 0.0, "breaker_s": 0.0}
+        self.failures = {}
+
+    def _pause(self, seconds, stat):
+        if seconds <= 0:
+            return
+        time.sleep(seconds)
+        self.stats[stat] += seconds
+        METRICS.observe(stat[:-2] + "_wait", seconds * 1000)
+
+    def fetch(self, locale, fn, keyword=""):
+        bucket = self.buckets.setdefault(locale, TokenBucket(self.rate, self.burst))
+        breaker = self.breakers.setdefault(locale, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+        self.stats["fetches"] += 1
+        for attempt in range(self.retries + 1):
+            self._pause(breaker.wait_time(), "breaker_s")
+            self._pause(bucket.wait_time(), "throttle_s")
+            bucket.take()
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify(e)
+                self.failures[kind] = self.failures.get(kind, 0) + 1
+                METRICS.count(f"fetch_{kind}", keyword, locale)
+                if kind == "throttled":
+                    bucket.slow_down()
+                cooldown = breaker.failure()
+                if cooldown:
+                    self.stats["trips"] += 1
+                    METRICS.count("breaker_open", keyword, locale)
+                    print(f"⏸ {locale}: {breaker.threshold} failed fetches in a row, pausing {cooldown:.0f}s")
+                    if self.on_trip:
+                        self.on_trip(locale)
+                if kind not in RETRYABLE or attempt == self.retries:
+                    self.stats["failed"] += 1
+                    raise
+                delay = min(BACKOFF_MAX, random.uniform(0, BACKOFF_BASE * 2 ** attempt))
+                if getattr(e, "retry_after", None):
+                    delay = max(delay, e.retry_after)
+                self.stats["retries"] += 1
+                METRICS.count("fetch_retry", keyword, locale)
+                self._pause(delay, "backoff_s")
+                continue
+            breaker.success()
+            bucket.speed_up()
+            return result
+
+    def summary(self):
+        s = self.stats
+        failures = ", ".join(f"{k}={v}" for k, v in sorted(self.failures.items())) or "none"
+        return (f"{s['fetches']} fetches, {s['retries']} retries, {s['failed']} gave up; waited "
+                f"{s['throttle_s']:.1f}s rate-limited, {s['backoff_s']:.1f}s backing off, "
+                f"{s['breaker_s']:.1f}s paused by {s['trips']} breaker trips; failures: {failures}")
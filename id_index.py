@@ -0,0 +1,100 @@
+import os, sqlite3
+from glob import glob
+
+INDEX_NAME = "seen_ids.sqlite"
+
+
+class IdIndex:
+    """Persistent set of seen post ids, optionally split into scopes (e.g. one per keyword).
+
+    `add` only marks an id as seen for the current run and returns False if
+    it was already seen, so it doubles as a claim. Ids are written to disk
+    by `commit` once their rows are saved, so a crash never leaves ids
+    recorded for posts that never reached a shard.
+    """
+
+    def __init__(self, db, scope=""):
+        self.db, self.scope = db, scope
+        self._pending = set()
+
+    def __contains__(self, pid):
+        pid = str(pid)
+        if pid in self._pending:
+            return True
+        row = self.db.execute("SELECT 1 FROM seen WHERE scope = ? AND id = ?", (self.scope, pid)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        (n,) = self.db.execute("SELECT COUNT(*) FROM seen WHERE scope = ?", (self.scope,)).fetchone()
+        return n + len(self._pending)
+
+    def add(self, pid):
+        if pid in self:
+            return False
+        self._pending.add(str(pid))
+        return True
+
+    def commit(self, ids):
+        ids = [str(i) for i in ids if i is not None and str(i) != ""]
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO seen (scope, id) VALUES (?, ?)", [(self.scope, i) for i in ids])
+        self._pending.difference_update(ids)
+
+    def release(self, ids):
+        """Drop claims on `ids` that were never committed, so they can be claimed again."""
+        self._pending.difference_update(str(i) for i in ids)
+
+    def forget(self, ids):
+        """Remove `ids` from the index, committed or not."""
+        ids = [str(i) for i in ids]
+        with self.db:
+            self.db.executemany("DELETE FROM seen WHERE scope = ? AND id = ?", [(self.scope, i) for i in ids])
+        self._pending.difference_update(ids)
+
+    def scoped(self, scope):
+        """Same index file, different scope."""
+        return IdIndex(self.db, scope)
+
+    def close(self):
+        self.db.close()
+
+
+def _connect(path, check_same_thread=True):
+    db = sqlite3.connect(path, check_same_thread=check_same_thread)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS seen (scope TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (scope, id)) WITHOUT ROWID")
+    return db
+
+
+def _rebuild(path, shard_glob, scope_column):
+    from sinks import is_shard_file, read_shard  # pandas, only needed for the one-time scan
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = _connect(tmp)
+    columns = ["id", scope_column] if scope_column else ["id"]
+    files = [f for f in glob(shard_glob) if is_shard_file(f)]
+    for file in files:
+        try:
+            df = read_shard(file, columns).dropna(subset=["id"])
+        except Exception:
+            continue
+        scopes = df[scope_column].fillna("").astype(str) if scope_column else [""] * len(df)
+        with db:
+            db.executemany("INSERT OR IGNORE INTO seen (scope, id) VALUES (?, ?)", zip(scopes, df["id"].astype(str)))
+    db.close()
+    os.replace(tmp, path)
+    print(f"Built id index from {len(files)} files -> {path}")
+
+
+def open_id_index(root, shard_glob, scope_column=None, check_same_thread=True):
+    """Open `root`/seen_ids.sqlite, building it from the `shard_glob` CSV/Parquet shards only if it does not exist yet.
+
+    Pass check_same_thread=False to share the index between threads; callers then serialize access themselves.
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, INDEX_NAME)
+    if not os.path.exists(path):
+        _rebuild(path, shard_glob, scope_column)
+    return IdIndex(_connect(path, check_same_thread))
@@ -0,0 +1,57 @@
+import unicodedata
+from collections import deque
+
+
+def fold(text):
+    """Case- and ё-insensitive form used on both keywords and post text."""
+    return unicodedata.normalize("NFC", text).casefold().replace("ё", "е")
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over (emotion, keyword) pairs.
+
+    Built once; `find_all` scans a text in a single pass and returns every
+    pair whose keyword occurs in it as a substring, in keyword-list order.
+    Cost is linear in the text length whatever the number of keywords.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = list(pairs)
+        self._goto, self._fail, self._out = [{}], [0], [[]]
+        for idx, (_, keyword) in enumerate(self.pairs):
+            state = 0
+            for ch in fold(keyword):
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            if state:
+                self._out[state].append(idx)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        if not text:
+            return []
+        goto, fail, out = self._goto, self._fail, self._out
+        found, state = set(), 0
+        for ch in fold(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return [self.pairs[i] for i in sorted(found)]
@@ -0,0 +1,191 @@
+"""Batched, cached language tagging for scraped posts.
+
+The fast backend is fastText's lid.176.ftz (under 1 MB): `pip install fasttext`
+and fetch the model once with `python lang_detect.py --download`. Without
+them, texts the alphabet cannot decide go to langdetect, which is several
+milliseconds per text; the scrapers tag off the crawl thread either way.
+"""
+import argparse, hashlib, os, re, time
+from collections import OrderedDict
+from glob import glob
+from langdetect import detect, DetectorFactory
+
+try:
+    import fasttext  # compact n-gram language ID (lid.176.ftz), used when the model file exists
+except ImportError:
+    fasttext = None
+
+DetectorFactory.seed = 0
+
+LID_MODEL_PATH = "models/lid.176.ftz"
+LID_MODEL_URL = "https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz"
+CACHE_SIZE = 200_000
+KAZAKH_LETTERS = set("әғқңөұүһ")
+OTHER_CYRILLIC_LETTERS = set("іїєґўђјљњћџѓќѕ")  # Ukrainian, Belarusian, Serbian, Macedonian
+_URLS_AND_MENTIONS = re.compile(r"http\S+|@\w+")
+
+_cache = OrderedDict()
+_stats = {"hits": 0, "script": 0, "backend": 0}
+_model = None
+_warned = False
+
+
+def normalize(text):
+    return " ".join(_URLS_AND_MENTIONS.sub(" ", text or "").casefold().split())
+
+
+def _key(norm):
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest()
+
+
+def script_language(norm):
+    """Language from the alphabet alone, or None when a statistical model is needed."""
+    letters = [ch for ch in norm if ch.isalpha()]
+    if not letters:
+        return "unknown"
+    cyrillic = sum(1 for ch in letters if "\u0400" <= ch <= "\u04ff")
+    if cyrillic * 2 < len(letters):
+        return None
+    chars = set(letters)
+    if chars & KAZAKH_LETTERS:
+        return "kk"
+    if chars & OTHER_CYRILLIC_LETTERS:
+        return None
+    return "ru"
+
+
+def _fasttext_model():
+    global _model, _warned
+    if _model is None and fasttext is not None and os.path.exists(LID_MODEL_PATH):
+        _model = fasttext.load_model(LID_MODEL_PATH)
+    if _model is None and not _warned:
+        _warned = True
+        missing = "fasttext is not installed" if fasttext is None else f"{LID_MODEL_PATH} is missing"
+        print(f"Language tagging falls back to langdetect ({missing}); see `python lang_detect.py --download`")
+    return _model
+
+
+def download_model(url=LID_MODEL_URL, path=LID_MODEL_PATH):
+    """Fetch the fastText language-ID model to `path`, atomically."""
+    import httpx
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with httpx.stream("GET", url, follow_redirects=True, timeout=60) as r:
+        r.raise_for_status()
+        with open(path + ".tmp", "wb") as f:
+            for block in r.iter_bytes():
+                f.write(block)
+    os.replace(path + ".tmp", path)
+    print(f"💾 {url} → {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+
+
+def _backend(texts):
+    model = _fasttext_model()
+    if model is not None:
+        labels, _ = model.predict(texts)
+        return [label[0].replace("__label__", "") if label else "unknown" for label in labels]
+    out = []
+    for text in texts:
+        try:
+            out.append(detect(text))
+        except Exception:
+            out.append("unknown")
+    return out
+
+
+def _remember(key, lang):
+    _cache[key] = lang
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def detect_languages(texts):
+    """Language codes for a batch of texts.
+
+    Cached by a hash of the normalized text. Cyrillic Russian/Kazakh is
+    decided by its letters; only the remaining misses go to the backend,
+    as a single batch.
+    """
+    results = [None] * len(texts)
+    misses = OrderedDict()
+    for i, text in enumerate(texts):
+        norm = normalize(text)
+        key = _key(norm)
+        lang = _cache.get(key)
+        if lang is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            results[i] = lang
+            continue
+        lang = script_language(norm)
+        if lang is None:
+            misses.setdefault(key, (norm, []))[1].append(i)
+            continue
+        _stats["script"] += 1
+        _remember(key, lang)
+        results[i] = lang
+
+    if misses:
+        langs = _backend([norm for norm, _ in misses.values()])
+        _stats["backend"] += len(misses)
+        for (key, (_, positions)), lang in zip(misses.items(), langs):
+            _remember(key, lang)
+            for i in positions:
+                results[i] = lang
+    return results
+
+
+def detect_language_safe(text):
+    return detect_languages([text])[0] if text else "unknown"
+
+
+def tag_languages(rows, text_field="text", field="lang_detect"):
+    """Fill `field` for a batch of rows in one detect_languages call."""
+    for row, lang in zip(rows, detect_languages([r.get(text_field) or "" for r in rows])):
+        row[field] = lang
+
+
+def stats_summary():
+    return f"{_stats['hits']} cache hits, {_stats['script']} by script, {_stats['backend']} by {'fasttext' if _model else 'langdetect'}"
+
+
+def main(argv=None):
+    """Parity against the langdetect labels already stored in scraped shards, or --download the fast model."""
+    ap = argparse.ArgumentParser(description="Compare language tagging with stored langdetect labels.")
+    ap.add_argument("shards", nargs="*")
+    ap.add_argument("--download", action="store_true", help=f"fetch {LID_MODEL_PATH} for the fastText backend")
+    args = ap.parse_args(argv)
+    if args.download:
+        return download_model()
+
+    from sinks import read_shard
+    import pandas as pd
+
+    paths = args.shards or glob("data/file/threads_*.csv")
+    df = pd.concat([read_shard(p, ["text", "lang_detect"]) for p in paths], ignore_index=True)
+    texts = df["text"].fillna("").astype(str).tolist()
+    reference = df["lang_detect"].fillna("unknown").astype(str)
+
+    start = time.perf_counter()
+    ours = pd.Series(detect_languages(texts), index=df.index)
+    elapsed = time.perf_counter() - start
+    sample = texts[:200]
+    start = time.perf_counter()
+    for text in sample:
+        try:
+            detect(text)
+        except Exception:
+            pass
+    per_text_ld = (time.perf_counter() - start) / max(1, len(sample))
+
+    print(f"{len(texts)} texts from {len(paths)} files")
+    print(f"agreement with stored langdetect labels: {(ours == reference).mean():.1%}")
+    for lang, group in reference.groupby(reference):
+        if len(group) >= 10:
+            print(f"  {lang:8s} n={len(group):5d} agree={(ours[group.index] == lang).mean():.1%}")
+    print(f"this module: {elapsed / len(texts) * 1000:.3f} ms/text ({stats_summary()})")
+    print(f"langdetect:  {per_text_ld * 1000:.3f} ms/text")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import bisect, json, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+FLUSH_EVERY = 30  # seconds between JSON-lines snapshots
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in milliseconds, Prometheus style."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count, self.sum = 0, 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {"count": self.count, "sum_ms": round(self.sum, 3), "buckets": dict(zip(
+            [str(b) for b in self.buckets] + ["+Inf"], self.counts))}
+
+
+class Metrics:
+    """Per-stage latency histograms plus counters labelled by (keyword, locale).
+
+    Stages are timed with `with METRICS.time("parse"):`; events are counted
+    with `METRICS.count("duplicate", keyword, locale)`. `tick` appends a
+    snapshot to the JSON-lines log at most every FLUSH_EVERY seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages, self.counters = {}, {}
+        self.log_path, self.run_id, self._last_flush = None, None, 0.0
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000)
+
+    def observe(self, stage, ms):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(ms)
+
+    def count(self, name, keyword="", locale="", n=1):
+        key = (name, keyword or "", locale or "")
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def total(self, name):
+        with self.lock:
+            return sum(v for (n, _, _), v in self.counters.items() if n == name)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "ts": time.time(),
+                "run": self.run_id,
+                "stages": {stage: h.snapshot() for stage, h in self.stages.items()},
+                "counters": [{"name": n, "keyword": k, "locale": l, "value": v}
+                             for (n, k, l), v in sorted(self.counters.items())],
+            }
+
+    def open_log(self, path, run_id=None):
+        self.log_path, self.run_id = path, run_id or f"run-{int(time.time())}"
+
+    def flush(self):
+        if not self.log_path:
+            return
+        line = json.dumps(self.snapshot(), ensure_ascii=False)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        self._last_flush = time.time()
+
+    def tick(self):
+        if self.log_path and time.time() - self._last_flush >= FLUSH_EVERY:
+            self.flush()
+
+    def summary(self):
+        """One line per stage (count, mean, p50, p95) and the counter totals."""
+        with self.lock:
+            lines = [f"{stage:18s} n={h.count:6d} mean={h.sum / h.count:8.1f}ms "
+                     f"p50<={h.quantile(0.5):g}ms p95<={h.quantile(0.95):g}ms"
+                     for stage, h in sorted(self.stages.items()) if h.count]
+            totals = {}
+            for (name, _, _), v in self.counters.items():
+                totals[name] = totals.get(name, 0) + v
+        return lines + [", ".join(f"{name}={v}" for name, v in sorted(totals.items()))]
+
+    def prometheus_text(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        out = ["# TYPE threads_stage_ms histogram"]
+        with self.lock:
+            for stage, h in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, n in zip([str(b) for b in h.buckets] + ["+Inf"], h.counts):
+                    cumulative += n
+                    out.append(f'threads_stage_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                out.append(f'threads_stage_ms_sum{{stage="{stage}"}} {h.sum}')
+                out.append(f'threads_stage_ms_count{{stage="{stage}"}} {h.count}')
+            out.append("# TYPE threads_events_total counter")
+            for (name, keyword, locale), v in sorted(self.counters.items()):
+                keyword = keyword.replace("\\", "\\\\").replace('"', '\\"')
+                out.append(f'threads_events_total{{event="{name}",keyword="{keyword}",locale="{locale}"}} {v}')
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
+
+
+def serve_prometheus(port, metrics=METRICS, host="127.0.0.1"):
+    """Expose `metrics` at http://<host>:<port>/metrics from a daemon thread; returns the server.
+
+    Counters are labelled by keyword and locale, so the default host keeps them local.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics at http://{host}:{port}/metrics")
+    return server
+
+
+def is_timeout(exc):
+    """Playwright and httpx timeouts, without importing either here."""
+    return "Timeout" in type(exc).__name__
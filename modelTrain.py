@@ -1,87 +1,108 @@
-import pandas as pd
-import torch 
-from torch.utils.data import DataLoader, Dataset
-from sklearn.model_selection import train_test_split
+import argparse
+from torch.utils.data import DataLoader
 from transformers import (
     DistilBertTokenizerFast,
     DistilBertForSequenceClassification,
     Trainer,
     TrainingArguments,
-) 
+)
 
-train_df = pd.read_csv("data/english/train.csv")
-test_df = pd.read_csv("data/english/test.csv")
+from dataPrepEDA import load_split
+from token_cache import LengthBucketSampler, TokenizedDataset, load_or_build, pad_collate
 
-#INSTALLATE TOKENIZER
-tokenizer = DistilBertTokenizerFast.from_pretrained('distilbert-base-uncased')
+BASE_MODEL = "distilbert-base-uncased"
+SAVE_PATH = "emotion_distilbert_model"
+MAX_LENGTH = 128
+EPOCHS = 2
+BATCH_SIZE = 8
+LEARNING_RATE = 5e-5
+WEIGHT_DECAY = 0.01
 
-train_encodings = tokenizer(
-    train_df['text'].tolist(),
-    truncation=True,
-    padding=True,
-    max_length=128
-)
-test_encodings = tokenizer(
-    test_df['text'].tolist(),
-    truncation=True,
-    padding=True,
-    max_length=128
-)
 
-class EmotionDataset(Dataset):
-    def __init__(self, encodings, labels):
-        self.encodings = encodings
-        self.labels = labels
-    
-    def __getitem__(self, index):
-        item = {key: torch.tensor(val[index]) for key, val in self.encodings.items()}
-        item['labels'] = torch.tensor(self.labels[index])
-        return item
-    
-    def __len__(self):
-        return len(self.labels)
-
-train_dataset = EmotionDataset(train_encodings, train_df['label'].tolist())
-test_dataset = EmotionDataset(test_encodings, test_df['label'].tolist())
-
-model = DistilBertForSequenceClassification.from_pretrained(
-    'distilbert-base-uncased',
-    num_labels=3
-)
+class BucketedTrainer(Trainer):
+    """Trainer whose batches come from LengthBucketSampler and are padded per batch by its data_collator."""
 
-training_args = TrainingArguments(
-    output_dir="./results",
-    do_eval=True,                    # replaces evaluation_strategy
-    num_train_epochs=2,
-    per_device_train_batch_size=8,
-    per_device_eval_batch_size=8,
-    learning_rate=5e-5,
-    weight_decay=0.01,
-    logging_dir="./logs",
-)
+    def _loader(self, dataset, batch_size, shuffle):
+        return self.accelerator.prepare(DataLoader(
+            dataset,
+            batch_sampler=LengthBucketSampler(dataset.cache.lengths, batch_size, shuffle=shuffle, seed=self.args.seed),
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+        ))
 
+    def get_train_dataloader(self):
+        return self._loader(self.train_dataset, self.args.per_device_train_batch_size, shuffle=True)
 
-#Train the model
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_dataset,
-    eval_dataset=test_dataset,
-)
-trainer.train()
+    def get_eval_dataloader(self, eval_dataset=None):
+        return self._loader(eval_dataset or self.eval_dataset, self.args.per_device_eval_batch_size, shuffle=False)
+
+
+def train(epochs=EPOCHS, batch_size=BATCH_SIZE, learning_rate=LEARNING_RATE, save_path=SAVE_PATH):
+    """Fine-tune BASE_MODEL on the prepared train split, evaluate on test, save to `save_path`; returns the eval metrics."""
+    train_df = load_split("train")
+    test_df = load_split("test")
+
+    #INSTALLATE TOKENIZER
+    tokenizer = DistilBertTokenizerFast.from_pretrained(BASE_MODEL)
+
+    # Unpadded token ids, memory-mapped from data/english/prepared/token_cache/;
+    # a rerun on the same data and tokenizer skips tokenization entirely
+    train_cache = load_or_build(tokenizer, train_df['text'].tolist(), train_df['label'].tolist(), max_length=MAX_LENGTH)
+    test_cache = load_or_build(tokenizer, test_df['text'].tolist(), test_df['label'].tolist(), max_length=MAX_LENGTH)
+
+    model = DistilBertForSequenceClassification.from_pretrained(BASE_MODEL, num_labels=3)
+
+    training_args = TrainingArguments(
+        output_dir="./results",
+        do_eval=True,                    # replaces evaluation_strategy
+        num_train_epochs=epochs,
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
+        learning_rate=learning_rate,
+        weight_decay=WEIGHT_DECAY,
+        logging_dir="./logs",
+    )
+
+    #Train the model
+    trainer = BucketedTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=TokenizedDataset(train_cache),
+        eval_dataset=TokenizedDataset(test_cache),
+        data_collator=pad_collate(tokenizer.pad_token_id),
+    )
+    trainer.train()
+
+    metrics = trainer.evaluate()
+    print("Evaluation metrics:", metrics)
+
+    #Save the model
+    model.save_pretrained(save_path)
+    tokenizer.save_pretrained(save_path)
+    print(f"Model and tokenizer saved to {save_path}")
+    return metrics
+
+
+def demo(save_path=SAVE_PATH):
+    from transformers import pipeline
+    classifier = pipeline("text-classification", model=save_path, tokenizer=save_path)
+    print(classifier("I am very happy today!"))
+    print(classifier("I feel so sad and depressed."))
+    print(classifier("The weather is okay, nothing special."))
 
-metrics = trainer.evaluate()
-print("Evaluation metrics:", metrics)
 
-#Save the model
-save_path = "emotion_distilbert_model"
-model.save_pretrained(save_path)
-tokenizer.save_pretrained(save_path)
-print(f"Model and tokenizer saved to {save_path}")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fine-tune DistilBERT on the prepared train/test splits.")
+    ap.add_argument("--epochs", type=float, default=EPOCHS)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--lr", type=float, default=LEARNING_RATE)
+    ap.add_argument("--save-path", default=SAVE_PATH)
+    ap.add_argument("--no-demo", action="store_true", help="skip classifying the example sentences afterwards")
+    args = ap.parse_args(argv)
+    train(args.epochs, args.batch_size, args.lr, args.save_path)
+    if not args.no_demo:
+        demo(args.save_path)
 
-from transformers import pipeline
-classifier = pipeline("text-classification", model=save_path, tokenizer=save_path)
-print(classifier("I am very happy today!"))
-print(classifier("I feel so sad and depressed."))
-print(classifier("The weather is okay, nothing special."))
 
+if __name__ == "__main__":
+    main()
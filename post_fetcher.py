@@ -0,0 +1,161 @@
+import httpx
+from metrics import METRICS, is_timeout
+from fetch_policy import FetchFailure, parse_retry_after
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+POST_PAGE_TIMEOUT = 20000
+HTTP_MAX_CONNECTIONS = 16
+LOGIN_MARKERS = ("/accounts/login", "/login")
+
+
+def has_thread_payload(html):
+    """True when the page carries the data-sjs JSON that scrape_thread_page reads."""
+    return bool(html) and "data-sjs" in html and "thread_items" in html
+
+
+def is_login_url(url):
+    return any(marker in (url or "") for marker in LOGIN_MARKERS)
+
+
+def raise_for_status(status, url, retry_after=None):
+    """FetchFailure for throttling (429) and server errors (5xx); other statuses are left to the caller."""
+    if status == 429:
+        raise FetchFailure("throttled", f"HTTP 429 for {url}", parse_retry_after(retry_after))
+    if status >= 500:
+        raise FetchFailure("server", f"HTTP {status} for {url}")
+
+
+def _client_options(transport=None):
+    return dict(
+        transport=transport,
+        http2=HTTP2,
+        follow_redirects=True,
+        timeout=POST_PAGE_TIMEOUT / 1000,
+        headers={"User-Agent": USER_AGENT},
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+    )
+
+
+def make_http_client(transport=None):
+    """Pooled keep-alive client reused for every post page in a run; `transport` swaps the network out (see replay.py)."""
+    return httpx.Client(**_client_options(transport))
+
+
+def make_async_http_client():
+    return httpx.AsyncClient(**_client_options())
+
+
+def _headers(accept_language):
+    return {"Accept-Language": accept_language} if accept_language else None
+
+
+def _checked_text(r, url):
+    raise_for_status(r.status_code, url, r.headers.get("retry-after"))
+    if is_login_url(str(r.url)):
+        METRICS.count("http_login")
+        return None
+    if r.status_code != 200 or not has_thread_payload(r.text):
+        return None
+    return r.text
+
+
+def fetch_html_http(client, url, accept_language=None):
+    """Plain GET of a post page. Returns None when the JSON payload is not in the response.
+
+    Raises FetchFailure on 429 and 5xx, which a browser retry would only make worse.
+    """
+    try:
+        with METRICS.time("http_get"):
+            r = client.get(url, headers=_headers(accept_language))
+    except httpx.HTTPError as e:
+        print("HTTP fetch error:", e)
+        METRICS.count("http_timeout" if isinstance(e, httpx.TimeoutException) else "http_error")
+        return None
+    return _checked_text(r, url)
+
+
+async def fetch_html_http_async(client, url, accept_language=None):
+    try:
+        with METRICS.time("http_get"):
+            r = await client.get(url, headers=_headers(accept_language))
+    except httpx.HTTPError as e:
+        print("HTTP fetch error:", e)
+        METRICS.count("http_timeout" if isinstance(e, httpx.TimeoutException) else "http_error")
+        return None
+    return _checked_text(r, url)
+
+
+def _check_page(response, page_url, url):
+    if response is not None:
+        raise_for_status(response.status, url, response.headers.get("retry-after"))
+    if is_login_url(page_url):
+        raise FetchFailure("login", f"redirected to login for {url}")
+
+
+def _no_content(exc, page_url, url):
+    """What a wait_for_selector timeout means: a login wall or a page without posts."""
+    if not is_timeout(exc):
+        return exc
+    if is_login_url(page_url):
+        return FetchFailure("login", f"login wall for {url}")
+    return FetchFailure("no_content", f"no [data-pressable-container] on {url}")
+
+
+def fetch_post_html(context, http, url, accept_language=None, timeout=POST_PAGE_TIMEOUT, page=None):
+    """Post page HTML over pooled HTTP, falling back to a browser page in `context`.
+
+    Pass http=None to always use the browser, and `page` to navigate an
+    existing page instead of opening and closing one. Throttling, server
+    errors, login walls and pages without posts raise FetchFailure.
+    """
+    if http is not None:
+        html = fetch_html_http(http, url, accept_language)
+        if html:
+            return html
+    own_page = page is None
+    if own_page:
+        page = context.new_page()
+    try:
+        with METRICS.time("goto"):
+            response = page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+        _check_page(response, page.url, url)
+        try:
+            with METRICS.time("wait_for_selector"):
+                page.wait_for_selector("[data-pressable-container=true]", timeout=8000)
+        except Exception as e:
+            raise _no_content(e, page.url, url)
+        with METRICS.time("content"):
+            return page.content()
+    finally:
+        if own_page:
+            page.close()
+
+
+async def fetch_post_html_async(context, http, url, accept_language=None, timeout=POST_PAGE_TIMEOUT):
+    if http is not None:
+        html = await fetch_html_http_async(http, url, accept_language)
+        if html:
+            return html
+    page = await context.new_page()
+    try:
+        with METRICS.time("goto"):
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+        _check_page(response, page.url, url)
+        try:
+            with METRICS.time("wait_for_selector"):
+                await page.wait_for_selector("[data-pressable-container=true]", timeout=8000)
+        except Exception as e:
+            raise _no_content(e, page.url, url)
+        with METRICS.time("content"):
+            return await page.content()
+    finally:
+        await page.close()
@@ -1,9 +1,300 @@
-from transformers import pipeline
+import argparse, json, os, queue, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
 
-classifier = pipeline("text-classification", model="emotion_distilbert_model", return_all_scores=True)
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
 
-print(classifier("I am very happy today!"))
-print(classifier("I feel so sad and depressed."))
-print(classifier("The weather is okay, nothing special."))
-print(classifier("I am extremely joyful and excited about my new job!"))
-print(classifier("For the first time in my life, I have never heard of a single one of these artists"))
+try:
+    import onnxruntime as ort
+except ImportError:  # only the "onnx" backend needs it
+    ort = None
+
+from dataPrepEDA import ASCII_ONLY, LABELS
+from sinks import copy_shard, is_shard_file
+from text_clean import clean_text
+
+MODEL_DIR = "emotion_distilbert_model"
+BACKENDS = ("torch", "int8", "onnx")  # fp32 PyTorch, dynamic-int8 PyTorch, ONNX Runtime
+BACKEND = "torch"
+INT8_WEIGHTS = "quantized.pt"
+ONNX_FILE = "model.onnx"
+SOURCE_GLOB = "data/english/threads_*"
+SCORED_DIR = "data/scored/"
+MAX_LENGTH = 128
+BATCH_SIZE = 64
+SCORE_CHUNK = 10_000  # rows read from a shard per step
+PROCESSES = 1
+THREADS = os.cpu_count() or 1  # torch intra-op threads, split across PROCESSES
+SERVE_PORT = 8765
+MAX_BATCH = 64          # texts per forward pass in the HTTP service
+MAX_WAIT_MS = 10        # how long the service waits for more requests to join a batch
+ID2LABEL = {i: name for name, i in LABELS.items()}
+SCORE_COLUMNS = ["pred_emotion"] + [f"p_{ID2LABEL[i]}" for i in sorted(ID2LABEL)]
+
+EXAMPLES = [
+    "I am very happy today!",
+    "I feel so sad and depressed.",
+    "The weather is okay, nothing special.",
+    "I am extremely joyful and excited about my new job!",
+    "For the first time in my life, I have never heard of a single one of these artists",
+]
+
+
+def backend_dir(model_dir, backend):
+    """Where export_model.py writes `backend`'s variant of `model_dir`."""
+    return model_dir if backend == "torch" else f"{model_dir.rstrip('/')}_{backend}"
+
+
+def quantize_int8(model):
+    """Linear layers with int8 weights and dynamically quantized activations."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class Predictor:
+    """Batched emotion classifier over the saved model.
+
+    `predict` sorts texts by length, so each batch is padded only to its own
+    longest text, and runs the forward passes under torch.inference_mode.
+    `backend` picks the fp32 model, its int8 variant or its ONNX graph, as
+    written by export_model.py next to `model_dir`.
+    """
+
+    def __init__(self, model_dir=None, threads=None, batch_size=None, backend=None):
+        model_dir, threads = model_dir or MODEL_DIR, threads or THREADS
+        batch_size, backend = batch_size or BATCH_SIZE, backend or BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        torch.set_num_threads(max(1, threads))
+        path = backend_dir(model_dir, backend)
+        self.backend, self.batch_size = backend, batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        if backend == "onnx":
+            if ort is None:
+                raise ImportError("onnxruntime is required for the onnx backend; install it or use torch/int8")
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = max(1, threads)
+            self.session = ort.InferenceSession(os.path.join(path, ONNX_FILE), options,
+                                                providers=["CPUExecutionProvider"])
+        elif backend == "int8":
+            model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(path))
+            self.model = quantize_int8(model.eval())
+            self.model.load_state_dict(torch.load(os.path.join(path, INT8_WEIGHTS)))
+        else:
+            self.model = AutoModelForSequenceClassification.from_pretrained(path).eval()
+
+    def _scores(self, texts):
+        if self.backend == "onnx":
+            enc = self.tokenizer(texts, truncation=True, max_length=MAX_LENGTH, padding=True, return_tensors="np")
+            (logits,) = self.session.run(["logits"], {"input_ids": enc["input_ids"].astype(np.int64),
+                                                      "attention_mask": enc["attention_mask"].astype(np.int64)})
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            return np.exp(logits) / np.exp(logits).sum(axis=-1, keepdims=True)
+        enc = self.tokenizer(texts, truncation=True, max_length=MAX_LENGTH, padding=True, return_tensors="pt")
+        return torch.softmax(self.model(**enc).logits, dim=-1).numpy()
+
+    def predict(self, texts):
+        """(len(texts), n_labels) softmax scores, rows in input order."""
+        scores = np.zeros((len(texts), len(ID2LABEL)), dtype=np.float32)
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        with torch.inference_mode():
+            for i in range(0, len(order), self.batch_size):
+                idx = order[i:i + self.batch_size]
+                scores[idx] = self._scores([texts[j] for j in idx])
+        return scores
+
+    def label(self, texts):
+        return [{"label": ID2LABEL[int(row.argmax())],
+                 "scores": {ID2LABEL[i]: round(float(p), 4) for i, p in enumerate(row)}}
+                for row in self.predict(texts)]
+
+
+def score_columns(predictor, texts):
+    """SCORE_COLUMNS for raw post texts, cleaned the way the training data was; empty texts get no label."""
+    cleaned = ["" if t is None or t != t else clean_text(str(t), ASCII_ONLY).strip() for t in texts]
+    keep = [i for i, t in enumerate(cleaned) if t]
+    scores = predictor.predict([cleaned[i] for i in keep])
+    columns = {name: [None] * len(texts) for name in SCORE_COLUMNS}
+    for i, row in zip(keep, scores):
+        columns["pred_emotion"][i] = ID2LABEL[int(row.argmax())]
+        for j, p in enumerate(row):
+            columns[f"p_{ID2LABEL[j]}"][i] = float(p)
+    return columns
+
+
+def scored_path(path, out_dir=SCORED_DIR):
+    """Base path (without extension) of the scored copy of shard `path`."""
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".scored")
+
+
+_predictor = None
+
+
+def _init_worker(model_dir, threads, batch_size, backend=BACKEND):
+    global _predictor
+    _predictor = Predictor(model_dir, threads, batch_size, backend)
+
+
+def score_shard(path, out_dir=SCORED_DIR):
+    """Write a copy of shard `path` with SCORE_COLUMNS added; returns (rows, seconds).
+
+    The copy keeps the shard's own schema and is renamed into place only when
+    complete, so an existing scored file always means the shard is done.
+    """
+    start = time.perf_counter()
+    rows = copy_shard(path, scored_path(path, out_dir),
+                      lambda chunk: score_columns(_predictor, chunk["text"].tolist()), SCORE_CHUNK)
+    return rows, time.perf_counter() - start
+
+
+def score(source_glob=SOURCE_GLOB, out_dir=SCORED_DIR, processes=PROCESSES, threads=None,
+          model_dir=MODEL_DIR, batch_size=BATCH_SIZE, backend=BACKEND):
+    """Score every shard matching `source_glob` that has no scored copy yet, reporting rows/sec."""
+    os.makedirs(out_dir, exist_ok=True)
+    shards = [p for p in sorted(glob(source_glob)) if is_shard_file(p)]
+    todo = [p for p in shards if not any(os.path.exists(scored_path(p, out_dir) + ext) for ext in (".csv", ".parquet"))]
+    print(f"{len(shards)} shards, {len(shards) - len(todo)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+    threads = threads or max(1, THREADS // processes)
+    started, total = time.perf_counter(), 0
+
+    def report(path, rows, seconds):
+        print(f"✅ {os.path.basename(path)}: {rows} rows, {rows / max(seconds, 1e-9):,.0f} rows/s")
+
+    if processes <= 1:
+        _init_worker(model_dir, threads, batch_size, backend)
+        for path in todo:
+            rows, seconds = score_shard(path, out_dir)
+            total += rows
+            report(path, rows, seconds)
+    else:
+        with ProcessPoolExecutor(processes, mp_context=get_context("spawn"), initializer=_init_worker,
+                                 initargs=(model_dir, threads, batch_size, backend)) as pool:
+            for path, (rows, seconds) in zip(todo, pool.map(score_shard, todo, [out_dir] * len(todo))):
+                total += rows
+                report(path, rows, seconds)
+    seconds = time.perf_counter() - started
+    print(f"📊 {total} rows in {seconds:.1f}s → {total / max(seconds, 1e-9):,.0f} rows/s "
+          f"({processes} process(es) × {threads} thread(s), {backend}) → {out_dir}")
+
+
+class MicroBatcher:
+    """Collects concurrent requests into shared forward passes.
+
+    A request waits at most MAX_WAIT_MS for others to join its batch; a
+    batch is run as soon as it holds MAX_BATCH texts.
+    """
+
+    def __init__(self, predictor, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.predictor, self.max_batch, self.max_wait = predictor, max_batch, max_wait_ms / 1000
+        self.requests = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, texts):
+        slot = {"texts": texts, "done": threading.Event()}
+        self.requests.put(slot)
+        slot["done"].wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["result"]
+
+    def _loop(self):
+        while True:
+            batch = [self.requests.get()]
+            n = len(batch[0]["texts"])
+            deadline = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                try:
+                    slot = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(slot)
+                n += len(slot["texts"])
+            try:
+                results = self.predictor.label([t for slot in batch for t in slot["texts"]])
+                for slot in batch:
+                    slot["result"], results = results[:len(slot["texts"])], results[len(slot["texts"]):]
+            except Exception as e:
+                for slot in batch:
+                    slot["error"] = e
+            for slot in batch:
+                slot["done"].set()
+
+
+def serve(port=SERVE_PORT, model_dir=MODEL_DIR, threads=THREADS, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS,
+          backend=BACKEND):
+    """POST {"texts": [...]} (or {"text": "..."}) to http://127.0.0.1:<port>/predict."""
+    batcher = MicroBatcher(Predictor(model_dir, threads, max_batch, backend), max_batch, max_wait_ms)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/predict":
+                return self._reply(404, {"error": "not found"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                texts = payload["texts"] if "texts" in payload else [payload["text"]]
+                texts = [str(t) for t in texts]
+            except (ValueError, KeyError, TypeError):
+                return self._reply(400, {"error": 'expected {"texts": [...]} or {"text": "..."}'})
+            try:
+                self._reply(200, {"predictions": batcher.submit(texts) if texts else []})
+            except Exception as e:
+                self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def do_GET(self):
+            self._reply(200, {"ok": True}) if self.path == "/health" else self._reply(404, {"error": "not found"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Scoring at http://127.0.0.1:{port}/predict (batches up to {max_batch}, {max_wait_ms}ms wait)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Emotion predictions for examples, whole shards, or over HTTP.")
+    ap.add_argument("--model", default=MODEL_DIR)
+    ap.add_argument("--backend", choices=BACKENDS, default=BACKEND, help="int8 and onnx need export_model.py first")
+    ap.add_argument("--threads", type=int, default=None, help="torch threads (per process when scoring)")
+    sub = ap.add_subparsers(dest="command")
+    sc = sub.add_parser("score", help="add prediction columns to every shard, resuming where it left off")
+    sc.add_argument("--source", default=SOURCE_GLOB)
+    sc.add_argument("--out", default=SCORED_DIR)
+    sc.add_argument("--processes", type=int, default=PROCESSES)
+    sc.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    sv = sub.add_parser("serve", help="local HTTP scoring endpoint with micro-batching")
+    sv.add_argument("--port", type=int, default=SERVE_PORT)
+    sv.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    sv.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = ap.parse_args(argv)
+
+    if args.command == "score":
+        score(args.source, args.out, args.processes, args.threads, args.model, args.batch_size, args.backend)
+    elif args.command == "serve":
+        serve(args.port, args.model, args.threads or THREADS, args.max_batch, args.max_wait_ms, args.backend)
+    else:
+        predictor = Predictor(args.model, args.threads or THREADS, backend=args.backend)
+        for text, result in zip(EXAMPLES, predictor.label(EXAMPLES)):
+            print(text, "→", result)
+
+
+if __name__ == "__main__":
+    main()
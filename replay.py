@@ -0,0 +1,270 @@
+import argparse, hashlib, json, os, random, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+import httpx
+
+from browser_pool import BLOCKED_RESOURCE_TYPES
+
+FIXTURE_ROOT = "data/fixtures/store"
+INDEX_NAME = "index.jsonl"
+# GraphQL POST bodies carry per-session tokens; only these fields identify the query.
+STABLE_BODY_FIELDS = ("doc_id", "variables", "fb_api_req_friendly_name")
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+FAULT_KINDS = ("429", "503", "login", "empty", "slow")
+SLOW_FAULT_SECONDS = 30  # longer than post_fetcher.POST_PAGE_TIMEOUT
+
+
+def _body_key(body):
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    try:
+        fields = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+    except UnicodeDecodeError:
+        fields = {}
+    stable = {k: fields[k] for k in STABLE_BODY_FIELDS if k in fields}
+    if stable:
+        return json.dumps(stable, sort_keys=True)
+    return hashlib.sha1(body).hexdigest()
+
+
+def fixture_key(method, url, body=None):
+    """Host- and percent-encoding-independent key: method, path and query, and the stable part of a POST body."""
+    parts = urlsplit(url)
+    target = unquote(parts.path) + ("?" + unquote(parts.query) if parts.query else "")
+    raw = f"{method.upper()} {target} {_body_key(body)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class FixtureStore:
+    """Recorded responses on disk: one body file per response plus an append-only index.
+
+    Later recordings of the same request replace earlier ones. `hits` and
+    `misses` count lookups, so a replay can report how much of it was served
+    from the store.
+    """
+
+    def __init__(self, root=FIXTURE_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.entries[entry["key"]] = entry
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, method, url, body, status, headers, content):
+        key = fixture_key(method, url, body)
+        with open(os.path.join(self.root, key), "wb") as f:
+            f.write(content)
+        entry = {
+            "key": key, "method": method.upper(), "url": url, "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in SKIPPED_HEADERS},
+        }
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.entries[key] = entry
+
+    def get(self, method, url, body=None):
+        """(status, headers, content) recorded for the request, or None."""
+        entry = self.entries.get(fixture_key(method, url, body))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(os.path.join(self.root, entry["key"]), "rb") as f:
+            return entry["status"], entry["headers"], f.read()
+
+    def pages(self, marker="thread_items"):
+        """Bodies of recorded HTML documents containing `marker`, e.g. post pages for parser benchmarks."""
+        for entry in self.entries.values():
+            if "html" not in entry["headers"].get("content-type", "html"):
+                continue
+            with open(os.path.join(self.root, entry["key"]), encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            if marker in text:
+                yield text
+
+
+class RecordingTransport(httpx.HTTPTransport):
+    """httpx transport that saves every response it receives into a FixtureStore."""
+
+    def __init__(self, store, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        content = response.read()
+        self.store.put(request.method, str(request.url), request.content, response.status_code,
+                       dict(response.headers), content)
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS}
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """httpx transport answering from a FixtureStore; unrecorded requests get a 404."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def handle_request(self, request):
+        found = self.store.get(request.method, str(request.url), request.content)
+        if found is None:
+            return httpx.Response(404, request=request)
+        status, headers, content = found
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+
+class FixtureSession:
+    """Record or replay one scraper run: routes for browser contexts and a transport for the HTTP client.
+
+    Pass `attach` as ContextPool's on_context and `transport()` to
+    make_http_client. When recording, requests the pool blocks anyway fall
+    through to its own route; when replaying, unrecorded requests are aborted.
+    """
+
+    def __init__(self, mode, root=FIXTURE_ROOT):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown fixture mode {mode!r}, expected 'record' or 'replay'")
+        self.mode, self.store = mode, FixtureStore(root)
+
+    def transport(self):
+        return RecordingTransport(self.store) if self.mode == "record" else ReplayTransport(self.store)
+
+    def attach(self, context):
+        context.route("**/*", self._record if self.mode == "record" else self._replay)
+
+    def _record(self, route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            route.fallback()
+            return
+        response = route.fetch()
+        self.store.put(request.method, request.url, request.post_data_buffer, response.status,
+                       response.headers, response.body())
+        route.fulfill(response=response)
+
+    def _replay(self, route):
+        request = route.request
+        found = self.store.get(request.method, request.url, request.post_data_buffer)
+        if found is None:
+            route.abort()
+            return
+        status, headers, content = found
+        route.fulfill(status=status, headers=headers, body=content)
+
+    def summary(self):
+        return f"{self.mode}: {len(self.store)} fixtures, {self.store.hits} hits, {self.store.misses} misses"
+
+
+def parse_faults(spec):
+    """{"429": 0.1, ...} from "429=0.1,login=0.05"."""
+    faults = {}
+    for part in filter(None, (spec or "").split(",")):
+        kind, _, p = part.partition("=")
+        if kind not in FAULT_KINDS:
+            raise ValueError(f"Unknown fault {kind!r}, expected one of {FAULT_KINDS}")
+        faults[kind] = float(p)
+    return faults
+
+
+def make_fixture_handler(store, faults=None):
+    """Request handler serving `store`; `faults` maps FAULT_KINDS to the probability of injecting each.
+
+    `faults` is read on every request, so changing the dict changes how flaky a running server is.
+    """
+    faults = {} if faults is None else faults
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, content=b"", headers=()):
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def _fault(self):
+            roll = random.random()
+            for kind, p in faults.items():
+                if roll < p:
+                    return kind
+                roll -= p
+            return None
+
+        def _serve(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else None
+            if self.path.startswith("/accounts/login"):
+                return self._reply(200, b"<html><body>Log in to continue</body></html>")
+            fault = self._fault()
+            if fault == "429":
+                return self._reply(429, b"", [("Retry-After", "1")])
+            if fault == "503":
+                return self._reply(503)
+            if fault == "login":
+                return self._reply(302, b"", [("Location", "/accounts/login/?next=" + self.path)])
+            if fault == "empty":
+                return self._reply(200, b"<html><body></body></html>")
+            if fault == "slow":
+                time.sleep(SLOW_FAULT_SECONDS)
+            found = store.get(self.command, self.path, body)
+            if found is None:
+                self.send_error(404, "not recorded")
+                return
+            status, headers, content = found
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = _serve
+
+        def log_message(self, *args):
+            pass
+
+    return FixtureHandler
+
+
+def serve(root=FIXTURE_ROOT, port=8765, faults=None):
+    """Serve the store over plain HTTP, by path, for clients that cannot use routes or transports.
+
+    With `faults`, it doubles as a flaky stand-in for Threads to exercise fetch_policy.
+    """
+    store = FixtureStore(root)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_fixture_handler(store, faults))
+    print(f"Serving {len(store)} fixtures from {root} on http://127.0.0.1:{port}/"
+          + (f" with faults {faults}" if faults else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"{store.hits} hits, {store.misses} misses")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve recorded fixtures over HTTP, optionally with injected failures.")
+    ap.add_argument("root", nargs="?", default=FIXTURE_ROOT)
+    ap.add_argument("port", nargs="?", type=int, default=8765)
+    ap.add_argument("--faults", default="", help=f"e.g. 429=0.1,503=0.05,login=0.05 (kinds: {', '.join(FAULT_KINDS)})")
+    args = ap.parse_args(argv)
+    serve(args.root, args.port, parse_faults(args.faults))
+
+
+if __name__ == "__main__":
+    main()
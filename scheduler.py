@@ -0,0 +1,106 @@
+import json, math, os, random, time
+from checkpoint import pair_key
+
+STATS_NAME = "pair_stats.json"
+EXPLORATION = 1.0          # UCB exploration weight
+DEAD_AFTER = 3             # consecutive zero-yield visits (across runs) before a pair is skipped
+DEAD_RETRY_AFTER = 7 * 24 * 3600  # dead pairs get one more try after this many seconds
+
+
+def _new_stats():
+    return {"visits": 0, "new_posts": 0, "page_loads": 0, "seconds": 0.0, "stagnant": 0, "last_visit": 0}
+
+
+class PairScheduler:
+    """Chooses the next (emotion, keyword, locale) pair to crawl.
+
+    The emotion furthest below its share of the target goes first. Within
+    that emotion, unvisited pairs are tried once, then UCB1 on new unique
+    posts per browser-minute picks between them. Yield stats and stagnation
+    streaks persist in `<root>/pair_stats.json`, so tags that keep returning
+    nothing are skipped on later runs until DEAD_RETRY_AFTER has passed.
+    Pairs in `exhausted` are skipped for the rest of this run only.
+    """
+
+    def __init__(self, keywords, locales, root, target_total, shares=None):
+        self.path = os.path.join(root, STATS_NAME)
+        self.pairs = {}
+        for emotion, keyword in keywords:
+            for locale, accept in locales:
+                self.pairs[pair_key(emotion, keyword, locale)] = (emotion, keyword, locale, accept)
+        emotions = list(dict.fromkeys(e for e, _ in keywords))
+        shares = shares or {e: 1 / len(emotions) for e in emotions}
+        self.targets = {e: max(1, target_total * shares.get(e, 0)) for e in emotions}
+        self.stats, self.exhausted = {}, set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self.stats = json.load(f)
+
+    def _stats(self, key):
+        return self.stats.setdefault(key, _new_stats())
+
+    def is_dead(self, key, now=None):
+        s = self.stats.get(key)
+        if not s or s["stagnant"] < DEAD_AFTER:
+            return False
+        return (now or time.time()) - s["last_visit"] < DEAD_RETRY_AFTER
+
+    def _rate(self, s):
+        return s["new_posts"] / max(s["seconds"] / 60, 1e-6)
+
+    def next_pair(self, got_by_emotion, exclude=()):
+        """(emotion, keyword, locale, accept) to crawl next, or None when no live pair is left."""
+        now = time.time()
+        live = [k for k in self.pairs if k not in exclude and k not in self.exhausted and not self.is_dead(k, now)]
+        if not live:
+            return None
+        by_emotion = {}
+        for k in live:
+            by_emotion.setdefault(self.pairs[k][0], []).append(k)
+        emotion = min(by_emotion, key=lambda e: got_by_emotion.get(e, 0) / self.targets.get(e, 1))
+        candidates = by_emotion[emotion]
+
+        unvisited = [k for k in candidates if not self.stats.get(k, {}).get("visits")]
+        if unvisited:
+            return self.pairs[random.choice(unvisited)]
+
+        total_visits = sum(self.stats[k]["visits"] for k in candidates)
+        best_rate = max(self._rate(self.stats[k]) for k in candidates) or 1.0
+
+        def ucb(k):
+            s = self.stats[k]
+            return self._rate(s) / best_rate + EXPLORATION * math.sqrt(2 * math.log(total_visits) / s["visits"])
+
+        return self.pairs[max(candidates, key=ucb)]
+
+    def record(self, key, new_posts, page_loads, seconds, exhausted=False):
+        """Yield of one visit; `exhausted` keeps the pair out of the rest of this run."""
+        if exhausted:
+            self.exhausted.add(key)
+        s = self._stats(key)
+        s["visits"] += 1
+        s["new_posts"] += new_posts
+        s["page_loads"] += page_loads
+        s["seconds"] += seconds
+        s["stagnant"] = 0 if new_posts else s["stagnant"] + 1
+        s["last_visit"] = time.time()
+        self.save()
+
+    def drop(self, key):
+        """Skip `key` for the rest of this run without counting a visit (e.g. the tag page failed to load)."""
+        self.exhausted.add(key)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.stats, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def summary(self, top=5):
+        """Best pairs by posts/minute, plus how many are currently dead."""
+        visited = [(k, s) for k, s in self.stats.items() if s["visits"] and k in self.pairs]
+        visited.sort(key=lambda kv: self._rate(kv[1]), reverse=True)
+        lines = [f"{k}: {self._rate(s):.1f} posts/min, {s['new_posts'] / max(s['page_loads'], 1):.2f} posts/page load"
+                 for k, s in visited[:top]]
+        dead = sum(1 for k in self.pairs if self.is_dead(k))
+        return lines + [f"{dead} of {len(self.pairs)} pairs dead"]
@@ -0,0 +1,258 @@
+import numbers, os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV output still works without pyarrow
+    pa = pq = None
+
+SINK_FORMATS = ("parquet", "csv")
+PARQUET_COMPRESSION = "zstd"
+
+# Parquet column types for the fields the scrapers emit; other columns are typed from their
+# first value (int64 for integers, float64 for floats) or stored as string.
+INT_COLUMNS = ("like_count", "reply_count", "image_count", "repost_count", "label")
+CATEGORY_COLUMNS = ("keyword", "emotion", "locale_context", "language_context", "lang_detect", "pred_emotion")
+FLOAT_PREFIXES = ("p_",)  # per-label probabilities added by predict.py
+
+
+def media_id(pid):
+    """64-bit media pk from a post id like "3754967602742408652_76501782801"."""
+    head = str(pid or "").split("_")[0]
+    return int(head) if head.isdigit() and int(head) < 2 ** 63 else None
+
+
+def _arrow_type(column, sample=None):
+    if column == "published_on":
+        return pa.timestamp("s", tz="UTC")
+    if column == "media_id" or column in INT_COLUMNS:
+        return pa.int64()
+    if column.startswith(FLOAT_PREFIXES):
+        return pa.float64()
+    if column == "videos":
+        return pa.list_(pa.string())
+    if column in CATEGORY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(sample, numbers.Integral) and not isinstance(sample, bool):
+        return pa.int64()
+    if isinstance(sample, numbers.Real) and not isinstance(sample, bool):
+        return pa.float64()
+    return pa.string()
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CsvSink:
+    """Appends batches to one CSV file; the first batch fixes the header."""
+
+    durable_on_write = True
+
+    def __init__(self, path):
+        self.path, self.rows, self.columns = path, 0, None
+
+    def write(self, rows):
+        df = pd.DataFrame(rows)
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df.reindex(columns=self.columns).to_csv(self.path, mode="a", header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    """Streams batches into one Parquet file, one row group per `write`.
+
+    The schema is fixed by the first batch: known fields get typed columns
+    (timestamps, int64 counts, dictionary-encoded labels), other numeric
+    columns int64 or float64, the rest strings. With `media_ids`, a
+    media_id column is derived from "id" unless the rows already carry one.
+    The file is written as `<path>.part` and renamed on close, since a
+    Parquet file without its footer is unreadable.
+    """
+
+    durable_on_write = False
+
+    def __init__(self, path, compression=PARQUET_COMPRESSION, media_ids=True):
+        self.path, self.compression, self.rows = path, compression, 0
+        self.media_ids, self.derive_media_id = media_ids, False
+        self.schema, self.writer = None, None
+
+    def _table(self, rows):
+        if self.schema is None:
+            columns = list(dict.fromkeys(c for r in rows for c in r))
+            if self.media_ids and "id" in columns and "media_id" not in columns:
+                columns.insert(columns.index("id") + 1, "media_id")
+                self.derive_media_id = True
+            samples = {c: next((r[c] for r in rows if not _is_missing(r.get(c))), None) for c in columns}
+            self.schema = pa.schema([(c, _arrow_type(c, samples[c])) for c in columns])
+        coerced = []
+        for r in rows:
+            r = dict(r)
+            if self.derive_media_id:
+                r["media_id"] = media_id(r.get("id"))
+            for field in self.schema:
+                value = r.get(field.name)
+                if pa.types.is_list(field.type):
+                    if isinstance(value, (list, tuple, np.ndarray)):
+                        r[field.name] = [str(v) for v in value]
+                    else:
+                        r[field.name] = None if _is_missing(value) else [str(value)]
+                elif _is_missing(value):
+                    r[field.name] = None
+                elif pa.types.is_integer(field.type) or pa.types.is_timestamp(field.type):
+                    r[field.name] = _int_or_none(value)
+                elif pa.types.is_floating(field.type):
+                    r[field.name] = _float_or_none(value)
+                elif not isinstance(value, str):
+                    r[field.name] = str(value)
+            coerced.append(r)
+        return pa.Table.from_pylist(coerced, schema=self.schema)
+
+    def write(self, rows):
+        if not rows:
+            return
+        table = self._table(rows)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path + ".part", self.schema, compression=self.compression)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            os.replace(self.path + ".part", self.path)
+
+
+def open_sink(fmt, base_path, media_ids=True):
+    """Sink for `base_path` plus the format's extension. Nothing is created until the first write.
+
+    `media_ids` adds the derived media_id column to Parquet scrape shards; prepared data leaves it out.
+    """
+    if fmt == "parquet":
+        if pa is None:
+            raise ImportError("pyarrow is required for parquet output; install it or use the csv format")
+        return ParquetSink(base_path + ".parquet", media_ids=media_ids)
+    if fmt == "csv":
+        return CsvSink(base_path + ".csv")
+    raise ValueError(f"Unknown output format {fmt!r}, expected one of {SINK_FORMATS}")
+
+
+class ShardWriter:
+    """Rolls over to a new sink every `shard_size` rows; `base_path_for(idx)` names each shard.
+
+    `on_durable(rows)` is called once rows are safely on disk: after every
+    write for CSV, when the shard is closed for Parquet.
+    """
+
+    def __init__(self, fmt, base_path_for, shard_size, on_durable=None, shard_idx=1):
+        self.fmt, self.base_path_for, self.shard_size = fmt, base_path_for, shard_size
+        self.on_durable = on_durable or (lambda rows: None)
+        self.shard_idx = shard_idx
+        self.sink = open_sink(fmt, base_path_for(shard_idx))
+        self._unflushed = []
+
+    @property
+    def path(self):
+        return self.sink.path
+
+    def write(self, rows):
+        if not rows:
+            return
+        self.sink.write(rows)
+        if self.sink.durable_on_write:
+            self.on_durable(rows)
+        else:
+            self._unflushed.extend(rows)
+        if self.sink.rows >= self.shard_size:
+            self._close_sink()
+            print(f"Closed shard #{self.shard_idx}: {self.sink.rows} rows -> {self.sink.path}")
+            self.shard_idx += 1
+            self.sink = open_sink(self.fmt, self.base_path_for(self.shard_idx))
+
+    def _close_sink(self):
+        self.sink.close()
+        if self._unflushed:
+            self.on_durable(self._unflushed)
+            self._unflushed = []
+
+    def close(self):
+        self._close_sink()
+
+
+def is_shard_file(path):
+    return path.endswith(".csv") or path.endswith(".parquet")
+
+
+def read_shard(path, columns=None):
+    """Load one CSV or Parquet shard, reading only `columns` when given."""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_shard(path, columns=None, chunk_rows=50_000):
+    """Read a shard as DataFrames of at most `chunk_rows` rows, so large shards never sit in memory whole."""
+    if path.endswith(".parquet"):
+        if pq is None:
+            yield pd.read_parquet(path, columns=columns)
+            return
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+def copy_shard(path, base_path, add_columns, chunk_rows=50_000):
+    """Copy shard `path` to `base_path` plus its extension, with the columns `add_columns(chunk)` returns added.
+
+    Parquet copies keep the source schema and type the new columns like
+    scraped fields (float64 probabilities, dictionary labels). The copy is
+    written under a ".tmp" name and renamed once complete, so an existing
+    copy is always whole. Returns the number of rows copied.
+    """
+    ext = os.path.splitext(path)[1]
+    tmp = base_path + ".tmp" + ext
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    rows, writer = 0, None
+    try:
+        for chunk in iter_shard(path, None, chunk_rows):
+            for name, values in add_columns(chunk).items():
+                chunk[name] = values
+            if ext == ".parquet":
+                if writer is None:
+                    source = pq.ParquetFile(path).schema_arrow.remove_metadata()
+                    schema = pa.schema(list(source) + [(c, _arrow_type(c)) for c in chunk.columns
+                                                       if c not in source.names])
+                    writer = pq.ParquetWriter(tmp, schema, compression=PARQUET_COMPRESSION)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            else:
+                chunk.to_csv(tmp, mode="a", header=rows == 0, index=False)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows:
+        os.replace(tmp, base_path + ext)
+    return rows
@@ -0,0 +1,100 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import httpx
+import pytest
+
+import fetch_policy
+import replay
+from fetch_policy import FetchFailure, FetchGuard
+from post_fetcher import fetch_post_html, make_http_client
+
+POST_HTML = b'<html><script type="application/json" data-sjs>{"thread_items": []}</script></html>'
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Fixture server with one recorded post page; the test sets `faults` to make it flaky."""
+    monkeypatch.setattr(fetch_policy, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(replay, "SLOW_FAULT_SECONDS", 0.5)
+    store = replay.FixtureStore(str(tmp_path))
+    store.put("GET", "/@u/post/C1", None, 200, {"Content-Type": "text/html"}, POST_HTML)
+    faults = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), replay.make_fixture_handler(store, faults))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    http = make_http_client()
+    yield faults, http, f"http://127.0.0.1:{httpd.server_port}/@u/post/C1"
+    http.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_server_errors_are_retried_then_raised(server):
+    faults, http, url = server
+    faults["503"] = 1.0
+    guard = FetchGuard(rate=1000, retries=2)
+    with pytest.raises(FetchFailure) as failure:
+        guard.fetch("en-US", lambda: fetch_post_html(None, http, url))
+    assert failure.value.kind == "server"
+    assert guard.failures == {"server": 3}
+    assert guard.stats["retries"] == 2 and guard.stats["failed"] == 1
+    assert guard.stats["backoff_s"] > 0
+
+    faults.clear()
+    assert guard.fetch("en-US", lambda: fetch_post_html(None, http, url)) == POST_HTML.decode()
+    assert guard.stats["fetches"] == 2 and guard.stats["failed"] == 1
+
+
+def test_throttling_waits_for_retry_after_and_slows_down(server):
+    faults, http, url = server
+    faults["429"] = 1.0
+    guard = FetchGuard(rate=1000, retries=1)
+    with pytest.raises(FetchFailure) as failure:
+        guard.fetch("en-US", lambda: fetch_post_html(None, http, url))
+    assert failure.value.kind == "throttled" and failure.value.retry_after == 1.0
+    assert guard.stats["backoff_s"] >= 1.0  # Retry-After: 1
+    assert guard.buckets["en-US"].rate == 250  # halved once per 429
+    assert guard.failures == {"throttled": 2}
+
+
+def test_breaker_opens_and_closes(server):
+    faults, http, url = server
+    faults["503"] = 1.0
+    tripped = []
+    guard = FetchGuard(rate=1000, retries=0, on_trip=tripped.append, breaker_threshold=3, breaker_cooldown=0.3)
+    for _ in range(3):
+        with pytest.raises(FetchFailure):
+            guard.fetch("ru-RU", lambda: fetch_post_html(None, http, url))
+    breaker = guard.breakers["ru-RU"]
+    assert tripped == ["ru-RU"] and guard.stats["trips"] == 1
+    assert 0 < breaker.wait_time() <= 0.3
+
+    faults.clear()
+    assert guard.fetch("ru-RU", lambda: fetch_post_html(None, http, url))
+    assert guard.stats["breaker_s"] > 0  # waited out the cooldown before fetching
+    assert breaker.wait_time() == 0 and breaker.failures == 0 and breaker.cooldown == 0.3
+    assert "en-US" not in guard.breakers  # other locales are unaffected
+    assert guard.failures == {"server": 3}
+
+
+def test_timeouts_are_retried(server):
+    faults, _, url = server
+    faults["slow"] = 1.0
+    guard = FetchGuard(rate=1000, retries=1)
+    with httpx.Client(timeout=0.1) as client:
+        with pytest.raises(httpx.TimeoutException):
+            guard.fetch("en-US", lambda: client.get(url))
+        faults.clear()
+        assert guard.fetch("en-US", lambda: client.get(url)).status_code == 200
+    assert guard.failures == {"timeout": 2}
+    assert guard.stats["retries"] == 1 and guard.stats["failed"] == 1
+
+
+def test_replay_guard_never_trips(server):
+    faults, http, url = server
+    faults["503"] = 1.0
+    guard = FetchGuard(1e6, retries=0, breaker_threshold=float("inf"))
+    for _ in range(20):
+        with pytest.raises(FetchFailure):
+            guard.fetch("en-US", lambda: fetch_post_html(None, http, url))
+    assert guard.stats["trips"] == 0 and guard.stats["breaker_s"] == 0
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from sinks import ShardWriter, copy_shard
+
+LABELS = ["sadness", "neutral", "happiness"]
+
+
+def scraped_rows(n):
+    return [{
+        "id": f"{3754967602742408652 + i}_76501782801", "code": f"C{i:04d}", "username": f"user{i}",
+        "text": "" if i % 7 == 0 else f"post number {i}", "published_on": 1718000000 + i,
+        "like_count": i, "reply_count": i % 3, "videos": [f"https://v/{i}.mp4"] if i % 2 else [],
+        "repost_count": 0, "keyword": "sad", "emotion": "sadness", "locale_context": "en_US",
+    } for i in range(n)]
+
+
+def write_shard(tmp_path, fmt, rows):
+    writer = ShardWriter(fmt, lambda idx: str(tmp_path / f"threads_{idx:04d}"), shard_size=len(rows) + 1)
+    writer.write(rows)
+    writer.close()
+    return writer.path
+
+
+def fake_scores(chunk):
+    texts = chunk["text"].tolist()
+    columns = {"pred_emotion": [LABELS[i % 3] if t else None for i, t in enumerate(texts)]}
+    for j, name in enumerate(LABELS):
+        columns[f"p_{name}"] = [float(j == i % 3) if t else None for i, t in enumerate(texts)]
+    return columns
+
+
+def test_copy_shard_keeps_parquet_schema(tmp_path):
+    source = write_shard(tmp_path, "parquet", scraped_rows(25))
+    rows = copy_shard(source, str(tmp_path / "threads_0001.scored"), fake_scores, chunk_rows=10)
+
+    assert rows == 25
+    copy = pq.read_table(tmp_path / "threads_0001.scored.parquet")
+    original = pq.read_table(source)
+    assert copy.column_names.count("media_id") == 1
+    for field in original.schema:
+        assert copy.schema.field(field.name).type == field.type
+    for name in LABELS:
+        assert copy.schema.field(f"p_{name}").type == pa.float64()
+    df = copy.to_pandas()
+    assert df["videos"].map(list).tolist() == original.to_pandas()["videos"].map(list).tolist()
+    assert df.loc[df["text"] == "", "pred_emotion"].isna().all()
+    assert df.loc[1, "p_neutral"] == 1.0
+    assert not list(tmp_path.glob("*.tmp*"))
+
+
+def test_copy_shard_csv(tmp_path):
+    source = write_shard(tmp_path, "csv", scraped_rows(12))
+    rows = copy_shard(source, str(tmp_path / "threads_0001.scored"), fake_scores, chunk_rows=5)
+
+    df = pd.read_csv(tmp_path / "threads_0001.scored.csv")
+    assert rows == len(df) == 12
+    assert list(df.columns[-4:]) == ["pred_emotion"] + [f"p_{name}" for name in LABELS]
+
+
+def test_score_shard_parquet(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    import predict
+
+    class FixedPredictor:
+        def predict(self, texts):
+            scores = np.zeros((len(texts), len(predict.ID2LABEL)), dtype=np.float32)
+            scores[:, 0] = 1.0
+            return scores
+
+    source = write_shard(tmp_path, "parquet", scraped_rows(30))
+    monkeypatch.setattr(predict, "_predictor", FixedPredictor())
+    rows, _ = predict.score_shard(source, str(tmp_path))
+
+    df = pd.read_parquet(predict.scored_path(source, str(tmp_path)) + ".parquet")
+    assert rows == len(df) == 30
+    assert set(predict.SCORE_COLUMNS) <= set(df.columns)
+    assert df[f"p_{predict.ID2LABEL[0]}"].dtype == np.float64
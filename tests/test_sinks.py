@@ -0,0 +1,35 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sinks import open_sink
+
+
+def write(tmp_path, rows, **kwargs):
+    sink = open_sink("parquet", str(tmp_path / "part-00001"), **kwargs)
+    sink.write(rows)
+    sink.close()
+    return pq.read_table(sink.path)
+
+
+def test_scrape_shard_gets_media_id(tmp_path):
+    table = write(tmp_path, [{"id": "3754967602742408652_76501782801", "text": "hi", "videos": np.array(["a", "b"])},
+                             {"id": "x", "text": None, "videos": np.array([], dtype=object)}])
+    assert table.column_names == ["id", "media_id", "text", "videos"]
+    assert table.column("media_id").to_pylist() == [3754967602742408652, None]
+    assert table.column("videos").to_pylist() == [["a", "b"], []]
+
+
+def test_existing_media_id_is_kept(tmp_path):
+    table = write(tmp_path, [{"id": "1_2", "media_id": 1, "text": "hi"}])
+    assert table.column_names == ["id", "media_id", "text"]
+
+
+def test_prep_partition_types(tmp_path):
+    rows = [{"text": "so sad", "id": "1_2", "label": np.int64(0), "score": float("nan")},
+            {"text": "great", "id": "3_4", "label": np.int64(2), "score": 0.5}]
+    table = write(tmp_path, rows, media_ids=False)
+    assert table.column_names == ["text", "id", "label", "score"]
+    assert table.schema.field("label").type == pa.int64()
+    assert table.schema.field("score").type == pa.float64()
+    assert table.column("label").to_pylist() == [0, 2]
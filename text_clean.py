@@ -0,0 +1,108 @@
+import hashlib, re, sqlite3, zlib
+import numpy as np
+
+NUM_PERM = 64            # MinHash permutations per text
+BANDS = 8                # LSH bands of NUM_PERM // BANDS rows; candidates from ~0.77 Jaccard up
+NEAR_DUP_THRESHOLD = 0.8  # estimated Jaccard at which two texts count as the same post
+SHINGLE = 5              # character shingle length
+
+_URLS_AND_MENTIONS = r"http\S+|@\w+"
+_CLEAN = re.compile(_URLS_AND_MENTIONS)
+_CLEAN_ASCII = re.compile(_URLS_AND_MENTIONS + r"|[^\x00-\x7f]+")
+_NON_WORD = re.compile(r"[\W_]+")
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2**31, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2**31, NUM_PERM).astype(np.uint64)
+
+
+def clean_text(text, ascii_only=True):
+    """URLs, mentions and (with ascii_only) non-ASCII runs removed in a single regex pass."""
+    return (_CLEAN_ASCII if ascii_only else _CLEAN).sub("", text)
+
+
+def normalize(text):
+    """Casefolded words only, the form near-duplicates are compared in."""
+    return " ".join(_NON_WORD.sub(" ", _CLEAN.sub(" ", text).casefold()).split())
+
+
+def minhash(norm):
+    """NUM_PERM-value MinHash signature over character shingles of normalized text."""
+    shingles = {norm[i:i + SHINGLE] for i in range(max(1, len(norm) - SHINGLE + 1))}
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((np.outer(h, _A) + _B) % _PRIME).min(axis=0)
+
+
+def clean_and_sign(texts, ascii_only=True):
+    """Worker task: cleaned texts and their MinHash signatures (computed on the text before ASCII stripping)."""
+    cleaned = [clean_text(t, ascii_only) for t in texts]
+    signatures = np.vstack([minhash(normalize(t)) for t in texts]) if texts else np.empty((0, NUM_PERM), np.uint64)
+    return cleaned, signatures
+
+
+def band_keys(signature):
+    rows = NUM_PERM // BANDS
+    return [int.from_bytes(hashlib.blake2b(signature[b * rows:(b + 1) * rows].tobytes(), digest_size=8).digest(),
+                           "big", signed=True) for b in range(BANDS)]
+
+
+class NearDupIndex:
+    """Persistent MinHash LSH index of kept texts.
+
+    `check_add` looks up the bands of a signature; a candidate whose
+    estimated Jaccard reaches the threshold makes the text a duplicate,
+    otherwise the text is kept and indexed. Like IdIndex, additions stay in
+    memory until `commit`, so a failed build leaves the index unchanged.
+    """
+
+    def __init__(self, path, threshold=NEAR_DUP_THRESHOLD):
+        self.db, self.threshold = sqlite3.connect(path), threshold
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS band (band INTEGER, key INTEGER, id TEXT, "
+                        "PRIMARY KEY (band, key, id)) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS sig (id TEXT PRIMARY KEY, sig BLOB) WITHOUT ROWID")
+        self._bands, self._sigs = {}, {}
+
+    def _signature(self, pid):
+        if pid in self._sigs:
+            return self._sigs[pid]
+        row = self.db.execute("SELECT sig FROM sig WHERE id = ?", (pid,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.uint64) if row else None
+
+    def check_add(self, pid, signature):
+        """Id of an already kept near-duplicate, or None after indexing `pid` as kept."""
+        keys = band_keys(signature)
+        seen = set()
+        for band, key in enumerate(keys):
+            ids = self._bands.get((band, key), [])
+            ids = ids + [r[0] for r in self.db.execute("SELECT id FROM band WHERE band = ? AND key = ?", (band, key))]
+            for other in ids:
+                if other in seen:
+                    continue
+                seen.add(other)
+                other_sig = self._signature(other)
+                if other_sig is not None and (other_sig == signature).mean() >= self.threshold:
+                    return other
+        for band, key in enumerate(keys):
+            self._bands.setdefault((band, key), []).append(pid)
+        self._sigs[pid] = signature
+        return None
+
+    def commit(self):
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO band (band, key, id) VALUES (?, ?, ?)",
+                                [(b, k, pid) for (b, k), ids in self._bands.items() for pid in ids])
+            self.db.executemany("INSERT OR REPLACE INTO sig (id, sig) VALUES (?, ?)",
+                                [(pid, s.tobytes()) for pid, s in self._sigs.items()])
+        self._bands, self._sigs = {}, {}
+
+    def forget(self, ids):
+        """Remove the committed signatures of `ids`, e.g. those of a partition that is being redone."""
+        rows = [(str(i),) for i in ids]
+        with self.db:
+            self.db.executemany("DELETE FROM sig WHERE id = ?", rows)
+            self.db.executemany("DELETE FROM band WHERE id = ?", rows)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,155 @@
+import json
+from parsel import Selector
+
+
+def _get(d, *keys):
+    for key in keys:
+        if not isinstance(d, dict):
+            return None
+        d = d.get(key)
+    return d
+
+
+def post_fields(item):
+    """Hand-written equivalent of the jmespath projection the scrapers used per thread item."""
+    if not isinstance(item, dict):
+        return None
+    post = item.get("post")
+    videos = _get(post, "video_versions")
+    if isinstance(videos, list):
+        videos = [v["url"] for v in videos if isinstance(v, dict) and v.get("url") is not None]
+    else:
+        videos = None
+    return {
+        "text": _get(post, "caption", "text"),
+        "published_on": _get(post, "taken_at"),
+        "id": _get(post, "id"),
+        "code": _get(post, "code"),
+        "username": _get(post, "user", "username"),
+        "like_count": _get(post, "like_count"),
+        "reply_count": item.get("view_replies_cta_string"),
+        "image_count": _get(post, "carousel_media_count"),
+        "videos": videos,
+        "repost_count": _get(post, "text_post_app_info", "repost_count"),
+    }
+
+
+def _bbox_results(data):
+    """Relay results along require[*][3][*].__bbox.require[*][3][1].__bbox.result."""
+    if not isinstance(data, dict):
+        return
+    for req in data.get("require") or ():
+        args = req[3] if isinstance(req, list) and len(req) > 3 else None
+        for arg in args if isinstance(args, list) else ():
+            bbox = arg.get("__bbox") if isinstance(arg, dict) else None
+            for inner in (bbox or {}).get("require") or ():
+                payload = inner[3] if isinstance(inner, list) and len(inner) > 3 else None
+                if not isinstance(payload, list) or len(payload) < 2 or not isinstance(payload[1], dict):
+                    continue
+                result = (payload[1].get("__bbox") or {}).get("result")
+                if isinstance(result, dict):
+                    yield result
+
+
+def _known_thread_items(data):
+    for result in _bbox_results(data):
+        d = result.get("data")
+        if isinstance(d, dict) and isinstance(d.get("data"), dict):
+            d = d["data"]
+        if not isinstance(d, dict):
+            continue
+        for edge in d.get("edges") or ():
+            node = (edge.get("node") if isinstance(edge, dict) else None) or {}
+            if isinstance(node.get("thread_items"), list):
+                yield node["thread_items"]
+        containing = d.get("containing_thread") or {}
+        if isinstance(containing.get("thread_items"), list):
+            yield containing["thread_items"]
+        for reply in d.get("reply_threads") or ():
+            if isinstance(reply, dict) and isinstance(reply.get("thread_items"), list):
+                yield reply["thread_items"]
+
+
+def _scan_thread_items(data):
+    """Fallback: every "thread_items" list anywhere in the tree."""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "thread_items" and isinstance(value, list):
+                    yield value
+                elif isinstance(value, (dict, list)):
+                    stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(v for v in reversed(node) if isinstance(v, (dict, list)))
+
+
+def find_thread_items(data):
+    """thread_items groups of one decoded data-sjs blob: known relay path first, full scan if it finds none."""
+    groups = list(_known_thread_items(data))
+    return groups or list(_scan_thread_items(data))
+
+
+def parse_thread(data):
+    """Extract main post data from one thread item."""
+    result = post_fields(data)
+    if not result:
+        return None
+
+    if result.get("reply_count") and not isinstance(result["reply_count"], int):
+        try:
+            first = str(result["reply_count"]).split(" ")[0]
+            result["reply_count"] = int(first) if first.isdigit() else 0
+        except Exception:
+            result["reply_count"] = 0
+
+    try:
+        result["url"] = f"https://www.threads.net/@{result['username']}/post/{result['code']}"
+    except Exception:
+        result["url"] = ""
+    result["repost_count"] = result.pop("repost_count")  # keep the CSV column order
+    return result
+
+
+def repost_count_from_spans(selector):
+    """Page-level fallback: the first "N reposts" span label, or 0."""
+    for txt in selector.css("span::text").getall():
+        if "repost" in txt.lower():
+            digits = "".join(ch for ch in txt if ch.isdigit())
+            if digits.isdigit():
+                return int(digits)
+    return 0
+
+
+def scrape_thread_page(page_source):
+    """Extract all posts from the Threads page source."""
+    selector = Selector(text=page_source)
+    datasets = selector.css('script[type="application/json"][data-sjs]::text').getall()
+    posts, seen_ids = [], set()
+    span_reposts = None  # scanned at most once, only if a post lacks the JSON count
+
+    for raw in datasets:
+        if '"ScheduledServerJS"' not in raw or "thread_items" not in raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except Exception:
+            continue
+
+        for group in find_thread_items(data):
+            for t in group:
+                parsed = parse_thread(t)
+                if not parsed:
+                    continue
+                pid = str(parsed.get("id") or "")
+                if not pid or pid in seen_ids:
+                    continue
+                seen_ids.add(pid)
+
+                if not isinstance(parsed.get("repost_count"), int):
+                    if span_reposts is None:
+                        span_reposts = repost_count_from_spans(selector)
+                    parsed["repost_count"] = span_reposts
+                posts.append(parsed)
+    return posts
@@ -0,0 +1,267 @@
+import asyncio, os, random, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlparse
+from playwright.async_api import async_playwright
+from post_fetcher import make_async_http_client, fetch_post_html_async
+from thread_parser import scrape_thread_page
+from browser_pool import context_options, block_heavy_async
+from metrics import METRICS, is_timeout
+from lang_detect import tag_languages
+
+from threads_autoscraper import (
+    TARGET_TOTAL, PER_KEYWORD_LIMIT, SCROLL_SLEEP, POST_PAGE_TIMEOUT, ROOT_SAVE_DIR, ROW_GROUP_SIZE,
+    ALL_KEYWORDS, LOCALES, EMOTION_SHARES, load_existing_ids_all, label_post,
+    save_shard, open_shard_writer, POST_FETCH_BACKEND,
+)
+from checkpoint import pair_key
+from scheduler import PairScheduler
+
+MAX_CONTEXTS = 4     # tag pages (one browser context each) crawled at the same time
+POST_WORKERS = 8     # post pages open at the same time, across all contexts
+PER_HOST_LIMIT = 6   # concurrent navigations per host
+PAIR_POLL = 1.0      # seconds an idle worker waits for in-flight pairs before asking again
+
+
+class CrawlLimits:
+    """Semaphores bounding post workers and navigations per host."""
+
+    def __init__(self, workers=None, per_host=None):
+        self.workers = asyncio.Semaphore(workers or POST_WORKERS)
+        self.per_host = per_host or PER_HOST_LIMIT
+        self._hosts = {}
+
+    def host(self, url):
+        netloc = urlparse(url).netloc
+        if netloc not in self._hosts:
+            self._hosts[netloc] = asyncio.Semaphore(self.per_host)
+        return self._hosts[netloc]
+
+
+class CrawlState:
+    """Counters and dedup set shared by all workers.
+
+    Everything here runs on the event loop thread and `accept` never awaits,
+    so a batch of posts is counted atomically without extra locking. Only
+    language tagging runs on a thread of its own before a group is saved.
+    """
+
+    def __init__(self, existing_ids):
+        self.global_cache_ids = existing_ids
+        self.collected, self.total, self.by_emotion = [], 0, {}
+        self.writer = open_shard_writer(lambda rows: existing_ids.commit([r.get("id") for r in rows]))
+        # One thread: groups are tagged in order and lang_detect's cache is never shared between threads.
+        self.tagger = ThreadPoolExecutor(1)
+        self.saving = None  # the last group's save task; each save waits for the one before it
+
+    def done(self):
+        return self.total >= TARGET_TOTAL
+
+    def accept(self, posts, emotion, keyword, locale, kw):
+        for p in posts:
+            if self.done() or kw["got"] >= PER_KEYWORD_LIMIT:
+                break
+            pid = str(p.get("id") or "")
+            if not pid:
+                continue
+            if pid in self.global_cache_ids:
+                METRICS.count("duplicate", keyword, locale)
+                continue
+            if not label_post(p, emotion, keyword, locale):
+                METRICS.count("keyword_reject", keyword, locale)
+                continue
+            METRICS.count("accepted", keyword, locale)
+
+            self.collected.append(p)
+            self.global_cache_ids.add(pid)
+            kw["got"] += 1
+            self.total += 1
+            self.by_emotion[p["emotion"]] = self.by_emotion.get(p["emotion"], 0) + 1
+
+            if len(self.collected) >= ROW_GROUP_SIZE:
+                self.flush()
+
+    def flush(self):
+        """Language-tag the buffered rows off the event loop, then save them after the previous group."""
+        rows, self.collected = self.collected, []
+        if rows:
+            self.saving = asyncio.ensure_future(self._save(rows, self.saving))
+
+    async def _save(self, rows, previous):
+        tagged = asyncio.get_running_loop().run_in_executor(self.tagger, _timed_tag, rows)
+        if previous is not None:
+            await previous
+        await tagged
+        save_shard(self.writer, rows)
+
+    async def drain(self):
+        """Flush and wait until every group is saved."""
+        self.flush()
+        if self.saving is not None:
+            await self.saving
+        self.tagger.shutdown()
+
+
+def _timed_tag(rows):
+    with METRICS.time("lang_detect"):
+        tag_languages(rows)
+
+
+def _timed_parse(html):
+    with METRICS.time("parse"):
+        return scrape_thread_page(html)
+
+
+async def fetch_post(context, http, limits, href, accept, kw_done, keyword, locale):
+    async with limits.workers, limits.host(href):
+        if kw_done():
+            return []
+        try:
+            html = await fetch_post_html_async(context, http, href, accept, POST_PAGE_TIMEOUT)
+        except Exception as e:
+            print("Post load error:", e)
+            METRICS.count("post_timeout" if is_timeout(e) else "post_error", keyword, locale)
+            return []
+    return await asyncio.to_thread(_timed_parse, html)
+
+
+async def crawl_pair(browser, http, limits, state, emotion, keyword, locale, accept):
+    """One visit to a tag page; returns (new posts, page loads, exhausted), or None if goto failed."""
+    context = await browser.new_context(**context_options(locale, accept))
+    await context.route("**/*", block_heavy_async)
+    page = await context.new_page()
+    search_url = f"https://www.threads.net/tag/{quote(keyword)}"
+    print(f"[{emotion}/{locale}] -> #{keyword}")
+
+    try:
+        async with limits.host(search_url):
+            with METRICS.time("tag_goto"):
+                await page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
+    except Exception as e:
+        print("Goto failed:", e)
+        METRICS.count("tag_timeout" if is_timeout(e) else "tag_error", keyword, locale)
+        await context.close()
+        return None
+
+    kw = {"got": 0}
+    seen_code, pending, stagnant, last_height = set(), set(), 0, 0
+
+    def kw_done():
+        return state.done() or kw["got"] >= PER_KEYWORD_LIMIT
+
+    async def handle(href):
+        posts = await fetch_post(context, http, limits, href, accept, kw_done, keyword, locale)
+        state.accept(posts, emotion, keyword, locale, kw)
+
+    try:
+        while not kw_done():
+            for link in await page.locator('a[href*="/post/"]').all():
+                href = await link.get_attribute("href")
+                if not href or "post" not in href:
+                    continue
+                if href.startswith("/"):
+                    href = "https://www.threads.net" + href
+                post_code = href.split("/")[-1]
+                if not post_code or post_code in seen_code:
+                    continue
+                seen_code.add(post_code)
+                pending.add(asyncio.create_task(handle(href)))
+
+            pending = {t for t in pending if not t.done()}
+            if kw_done():
+                break
+            await page.mouse.wheel(0, random.randint(2200, 3000))
+            await asyncio.sleep(random.uniform(*SCROLL_SLEEP))
+            try:
+                new_height = await page.evaluate("document.body.scrollHeight")
+            except Exception:
+                new_height = last_height
+            stagnant = stagnant + 1 if new_height == last_height else 0
+            last_height = new_height
+            if stagnant:
+                METRICS.count("scroll_stagnant", keyword, locale)
+            if stagnant >= 3:
+                METRICS.count("feed_end", keyword, locale)
+                break
+
+        # Let queued posts finish unless the limits are already met.
+        if pending and not kw_done():
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await context.close()
+    return kw["got"], 1 + len(seen_code), kw["got"] == 0 or stagnant >= 3
+
+
+async def run_autoscrape_async(contexts=None, workers=None, per_host=None):
+    """Crawl with `contexts` tag pages and `workers` post pages at once (MAX_CONTEXTS, POST_WORKERS by default)."""
+    contexts, workers = contexts or MAX_CONTEXTS, workers or POST_WORKERS
+    os.makedirs(ROOT_SAVE_DIR, exist_ok=True)
+    state = CrawlState(load_existing_ids_all())
+    print(f"Found {len(state.global_cache_ids)} existing IDs in {ROOT_SAVE_DIR}/")
+
+    limits = CrawlLimits(workers, per_host)
+    METRICS.open_log(os.path.join(ROOT_SAVE_DIR, "metrics.jsonl"))
+    scheduler = PairScheduler(ALL_KEYWORDS, LOCALES, ROOT_SAVE_DIR, TARGET_TOTAL, EMOTION_SHARES)
+    in_flight = set()
+    started = time.time()
+
+    http = make_async_http_client() if POST_FETCH_BACKEND == "http" else None
+
+    async def pair_worker():
+        # Each of the `contexts` workers crawls one tag page at a time, asking
+        # the scheduler for the next pair that nobody else is visiting. Pairs
+        # in flight may come back live, so a worker only stops once none are.
+        while not state.done():
+            pair = scheduler.next_pair(state.by_emotion, exclude=in_flight)
+            if pair is None:
+                if not in_flight:
+                    return
+                await asyncio.sleep(PAIR_POLL)
+                continue
+            emotion, keyword, locale, accept = pair
+            key = pair_key(emotion, keyword, locale)
+            in_flight.add(key)
+            visit_started = time.perf_counter()
+            try:
+                result = await crawl_pair(browser, http, limits, state, emotion, keyword, locale, accept)
+            finally:
+                in_flight.discard(key)
+            if result is None:
+                scheduler.drop(key)
+                continue
+            got, page_loads, exhausted = result
+            scheduler.record(key, got, page_loads, time.perf_counter() - visit_started, exhausted)
+            METRICS.tick()
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+
+        await asyncio.gather(*(pair_worker() for _ in range(contexts)))
+        if not state.done():
+            print("No live (keyword, locale) pairs left — stopping.")
+
+        await state.drain()
+        state.writer.close()
+        await browser.close()
+
+    if http is not None:
+        await http.aclose()
+    state.global_cache_ids.close()
+
+    minutes = (time.time() - started) / 60
+    rate = state.total / minutes if minutes else 0.0
+    print(f"Done. Collected total {state.total} posts (including shards) "
+          f"in {minutes:.1f} min ({rate:.1f} posts/min, {workers} workers).")
+    print(f"Posts by emotion: {state.by_emotion}")
+    for line in scheduler.summary():
+        print(f"  {line}")
+    METRICS.flush()
+    print("Stage timings:")
+    for line in METRICS.summary():
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_autoscrape_async())
@@ -1,12 +1,20 @@
-import json, time, os, re, random
-from parsel import Selector
-from nested_lookup import nested_lookup
-import jmespath
+import time, os, re, random
 from playwright.sync_api import sync_playwright
-import pandas as pd
 from urllib.parse import quote
-from langdetect import detect, DetectorFactory
-from glob import glob
+from post_fetcher import make_http_client, fetch_post_html
+from thread_parser import scrape_thread_page
+from id_index import open_id_index
+from sinks import ShardWriter
+from checkpoint import Checkpoint, pair_key, remove_partial_shards
+from browser_pool import ContextPool, latency_summary
+from lang_detect import stats_summary
+from keyword_matcher import KeywordMatcher
+from scheduler import PairScheduler
+from replay import FixtureSession
+from metrics import METRICS, serve_prometheus, is_timeout
+from classify_stage import ClassifyStage, RowStage
+from feed_harvest import FeedHarvester
+from fetch_policy import FetchGuard, classify
 
 TARGET_TOTAL = 15000
 PER_KEYWORD_LIMIT = 120
@@ -14,14 +22,20 @@ SCROLL_SLEEP = (1.2, 2.5)
 POST_PAGE_TIMEOUT = 20000
 ROOT_SAVE_DIR = "data/file/"
 SHARD_SIZE = 1000
-
-DetectorFactory.seed = 0
-
-def detect_language_safe(text):
-    try:
-        return detect(text) if text else "unknown"
-    except:
-        return "unknown"
+ROW_GROUP_SIZE = 250  # rows buffered before they are appended to the open shard
+OUTPUT_FORMAT = "parquet"  # or "csv"
+POST_FETCH_BACKEND = "http"  # "http": pooled HTTP first, browser fallback; "browser": always Chromium
+EMOTION_SHARES = {"sad": 1 / 3, "neutral": 1 / 3, "happy": 1 / 3}  # target share of TARGET_TOTAL per emotion
+REUSE_BROWSER = True  # one context per locale and recycled pages; False restores per-pair contexts
+FIXTURE_MODE = None  # "record": save every response to replay.FIXTURE_ROOT; "replay": serve them back offline
+METRICS_PORT = None  # e.g. 9108 to expose stage timings and counters at /metrics for Prometheus
+METRICS_HOST = "127.0.0.1"  # "0.0.0.0" to let a Prometheus server on another host scrape it
+FETCH_RATE = 1.0  # post-page fetches per second per locale; throttling halves it, see fetch_policy.py
+FEED_HARVEST = True  # posts and links from the tag feed's GraphQL responses; False polls the DOM for links
+CLASSIFY_MODEL = None  # e.g. "emotion_distilbert_model" to label posts with the trained model while crawling
+CLASSIFY_BACKEND = "torch"  # see predict.BACKENDS
+CLASSIFY_THREADS = 2  # torch threads for the background classifier
+CLASSIFY_FILTER = False  # drop posts whose predicted emotion disagrees with their keyword emotion
 
 SAD = [
     "грустный","грусть","печаль","тоска","депрессия","одиночество","одиноко","слёзы","плачу","боль",
@@ -48,204 +62,332 @@ LOCALES = [
 ]
 
 def load_existing_ids_all():
-    existing = set()
-    os.makedirs(ROOT_SAVE_DIR, exist_ok=True)
-    for file in glob(f"{ROOT_SAVE_DIR}/threads_*.csv"):
-        try:
-            df = pd.read_csv(file, usecols=["id"])
-            existing.update(df["id"].dropna().astype(str))
-        except Exception:
-            continue
-    return existing
-
-def parse_thread(data):
-    result = jmespath.search(
-        """{
-            text: post.caption.text,
-            published_on: post.taken_at,
-            id: post.id,
-            code: post.code,
-            username: post.user.username,
-            like_count: post.like_count,
-            reply_count: view_replies_cta_string,
-            image_count: post.carousel_media_count,
-            videos: post.video_versions[].url
-        }""",
-        data,
+    """Seen-id index for ROOT_SAVE_DIR; scans the shards only the first time."""
+    return open_id_index(ROOT_SAVE_DIR, f"{ROOT_SAVE_DIR}/threads_*")
+
+KEYWORD_MATCHER = KeywordMatcher(ALL_KEYWORDS)
+
+def label_post(p, emotion, keyword, locale):
+    """Attach crawl labels plus every matching keyword; False if the text matches none.
+
+    The crawled (emotion, keyword) stays the primary label when it occurs in
+    the text, otherwise the first match in keyword-list order is used.
+    """
+    matches = KEYWORD_MATCHER.find_all(p.get("text") or "")
+    if not matches:
+        return False
+    if (emotion, keyword) not in matches:
+        emotion, keyword = matches[0]
+    # lang_detect is filled in batches off the crawl thread (classify_stage.RowStage)
+    p["keyword"], p["emotion"], p["locale_context"], p["lang_detect"] = keyword, emotion, locale, None
+    p["matched_keywords"] = "|".join(k for _, k in matches)
+    p["matched_emotions"] = "|".join(dict.fromkeys(e for e, _ in matches))
+    return True
+
+def shard_prefix(worker=None):
+    """File name prefix of autoscrape shards; workers get their own so parallel writers never clash."""
+    return f"threads_autoscrape_{worker}_shard" if worker else "threads_autoscrape_shard"
+
+def open_shard_writer(on_durable=None, worker=None):
+    prefix = shard_prefix(worker)
+    return ShardWriter(
+        OUTPUT_FORMAT,
+        lambda idx: f"{ROOT_SAVE_DIR}/{prefix}{idx}_{int(time.time())}",
+        SHARD_SIZE,
+        on_durable,
     )
-    if not result:
-        return None
-
-    if result.get("reply_count") and not isinstance(result["reply_count"], int):
-        try:
-            first = str(result["reply_count"]).split(" ")[0]
-            result["reply_count"] = int(first) if first.isdigit() else 0
-        except:
-            result["reply_count"] = 0
-
-    try:
-        result["url"] = f"https://www.threads.net/@{result['username']}/post/{result['code']}"
-    except:
-        result["url"] = ""
-    result["repost_count"] = 0
-    return result
-
-def scrape_thread_page(page_source):
-    selector = Selector(text=page_source)
-    datasets = selector.css('script[type="application/json"][data-sjs]::text').getall()
-    posts, seen_ids = [], set()
-
-    for raw in datasets:
-        if '"ScheduledServerJS"' not in raw or "thread_items" not in raw:
-            continue
-        try:
-            data = json.loads(raw)
-        except:
-            continue
-
-        thread_items = nested_lookup("thread_items", data)
-        for group in thread_items:
-            for t in group:
-                parsed = parse_thread(t)
-                if not parsed:
-                    continue
-                pid = str(parsed.get("id"))
-                if not pid or pid in seen_ids:
-                    continue
-                seen_ids.add(pid)
-
-                repost_count = 0
-                for txt in selector.css("span::text").getall():
-                    if "repost" in txt.lower():
-                        digits = "".join(ch for ch in txt if ch.isdigit())
-                        if digits.isdigit():
-                            repost_count = int(digits)
-                            break
-                parsed["repost_count"] = repost_count
-                posts.append(parsed)
-    return posts
-
-def keyword_in_text(text, keyword):
-    return keyword.lower() in text.lower() if text and keyword else False
 
-def save_shard(rows, shard_idx):
+def save_shard(writer, rows):
+    """Append language-tagged rows to the open shard (one Parquet row group)."""
     if not rows:
         return
-    df = pd.DataFrame(rows)
-    fname = f"{ROOT_SAVE_DIR}/threads_autoscrape_shard{shard_idx}_{int(time.time())}.csv"
-    df.to_csv(fname, index=False)
-    print(f"Saved shard #{shard_idx}: {len(df)} rows -> {fname}")
+    with METRICS.time("save"):
+        writer.write(rows)
+    print(f"Saved {len(rows)} rows -> shard #{writer.shard_idx} ({writer.path})")
+
+def harvest_links(page, seen_code):
+    """New post URLs visible on the tag page, marking their codes as seen."""
+    hrefs = []
+    for link in page.locator('a[href*="/post/"]').all():
+        href = link.get_attribute("href")
+        if not href or "post" not in href:
+            continue
+        if href.startswith("/"):
+            href = "https://www.threads.net" + href
+        post_code = href.split("/")[-1]
+        if not post_code or post_code in seen_code:
+            continue
+        seen_code.add(post_code)
+        hrefs.append(href)
+    return hrefs
+
+def run_autoscrape(scheduler=None, global_cache_ids=None, worker=None):
+    """Crawl until TARGET_TOTAL or until no live pair is left; returns the run's counters.
 
-def run_autoscrape():
+    As a coordinator.py worker, `scheduler` and `global_cache_ids` are the
+    coordinator's shared work queue and id index, and `worker` names this
+    process's checkpoint directory and shard files.
+    """
     os.makedirs(ROOT_SAVE_DIR, exist_ok=True)
-    global_cache_ids = load_existing_ids_all()
+    shared = global_cache_ids is not None
+    if not shared:
+        global_cache_ids = load_existing_ids_all()
     print(f"Found {len(global_cache_ids)} existing IDs in {ROOT_SAVE_DIR}/")
 
-    collected, shard_idx, total = [], 1, 0
-    random.shuffle(ALL_KEYWORDS)
+    state_dir = os.path.join(ROOT_SAVE_DIR, f"worker_{worker}") if worker else ROOT_SAVE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    ckpt = Checkpoint(state_dir)
+    remove_partial_shards(ROOT_SAVE_DIR, shard_prefix(worker) + "*")
+    if scheduler is None:
+        scheduler = PairScheduler(ALL_KEYWORDS, LOCALES, ROOT_SAVE_DIR, TARGET_TOTAL, EMOTION_SHARES)
+    collected = []
+    if ckpt.resumed:
+        for row in ckpt.pending_rows():
+            pid = str(row.get("id") or "")
+            if pid and pid not in global_cache_ids:
+                collected.append(row)
+                global_cache_ids.add(pid)
+        print(f"Resuming: {len(ckpt.state['done'])} pairs exhausted, "
+              f"{len(collected)} unsaved rows replayed, {ckpt.state['total']} posts so far")
+    for key in ckpt.state["done"]:
+        scheduler.drop(key)
+    total, by_emotion = ckpt.state["total"], ckpt.state["by_emotion"]
+
+    # Language tagging, and classification with CLASSIFY_MODEL, run on the stage's worker thread.
+    stage = ClassifyStage(CLASSIFY_MODEL, CLASSIFY_BACKEND, CLASSIFY_THREADS, CLASSIFY_FILTER) \
+        if CLASSIFY_MODEL else RowStage()
+
+    def on_durable(rows):
+        global_cache_ids.commit([r.get("id") for r in rows])
+        ckpt.rows_saved()
+        # Replayed, buffered or still-processing rows not yet in a shard must stay in the log.
+        for r in collected + stage.pending_rows():
+            ckpt.log_row(r)
+
+    def save_classified(kept, rejected):
+        nonlocal total
+        if rejected:
+            # Rejected ids are recorded as seen so later runs do not fetch them again.
+            global_cache_ids.commit([r.get("id") for r in rejected])
+            for r in rejected:
+                total -= 1
+                by_emotion[r["emotion"]] -= 1
+                METRICS.count("model_disagree", r.get("keyword"), r.get("locale_context"))
+        save_shard(writer, kept)
+
+    def save_rows(rows):
+        """Hand the rows to the stage and save whatever it has finished."""
+        stage.submit(rows)
+        save_classified(*stage.ready())
+
+    writer = open_shard_writer(on_durable, worker)
+    METRICS.open_log(os.path.join(state_dir, "metrics.jsonl"), worker)
+    if METRICS_PORT:
+        serve_prometheus(METRICS_PORT, host=METRICS_HOST)
+    fixtures = FixtureSession(FIXTURE_MODE) if FIXTURE_MODE else None
+    transport = fixtures.transport() if fixtures else None
+    http = make_http_client(transport) if POST_FETCH_BACKEND == "http" else None
+
+    post_latency = []
+    parsed = duplicates = 0
+    started_run = time.perf_counter()
+
+    def accept_posts(posts, emotion, keyword, locale, room):
+        """Label, dedup and buffer posts found for one pair; returns how many were accepted, at most `room`."""
+        nonlocal duplicates
+        accepted = 0
+        for p in posts:
+            if accepted >= room:
+                break
+            pid = str(p.get("id") or "")
+            if not pid:
+                continue
+            if pid in global_cache_ids:
+                duplicates += 1
+                METRICS.count("duplicate", keyword, locale)
+                continue
+            if not label_post(p, emotion, keyword, locale):
+                METRICS.count("keyword_reject", keyword, locale)
+                continue
+            if not global_cache_ids.add(pid):
+                duplicates += 1  # another worker claimed it since the check above
+                METRICS.count("duplicate", keyword, locale)
+                continue
+            METRICS.count("accepted", keyword, locale)
+
+            ckpt.log_row(p)
+            collected.append(p)
+            accepted += 1
+            by_emotion[p["emotion"]] = by_emotion.get(p["emotion"], 0) + 1
+
+            if len(collected) >= ROW_GROUP_SIZE:
+                rows = collected[:]
+                collected.clear()
+                save_rows(rows)
+        return accepted
 
     with sync_playwright() as pw:
         browser = pw.chromium.launch(headless=True)
+        pool = ContextPool(browser, reuse=REUSE_BROWSER, on_context=fixtures.attach if fixtures else None)
+        # Replayed fixtures are local and deterministic: no pacing, no breaker, and a miss stays a miss.
+        if FIXTURE_MODE == "replay":
+            guard = FetchGuard(1e6, retries=0, breaker_threshold=float("inf"))
+        else:
+            guard = FetchGuard(FETCH_RATE, on_trip=pool.retire)
 
         while total < TARGET_TOTAL:
-            progress = 0
-            for emotion, keyword in ALL_KEYWORDS:
-                if total >= TARGET_TOTAL:
+            current = ckpt.state["current"]
+            if current:
+                emotion, keyword, locale = current.split("|")
+                accept = dict(LOCALES)[locale]
+            else:
+                pair = scheduler.next_pair(by_emotion)
+                if pair is None:
+                    print("No live (keyword, locale) pairs left — stopping.")
                     break
-                for locale, accept in LOCALES:
-                    if total >= TARGET_TOTAL:
+                emotion, keyword, locale, accept = pair
+            key = pair_key(emotion, keyword, locale)
+
+            visit_started = time.perf_counter()
+            pooled = pool.get(locale, accept)
+            page = pooled.tag_page()
+            search_url = f"https://www.threads.net/tag/{quote(keyword)}"
+            print(f"[{emotion}/{locale}] -> #{keyword}")
+            feed = FeedHarvester(page) if FEED_HARVEST else None
+
+            try:
+                with METRICS.time("tag_goto"):
+                    page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
+                if feed:
+                    feed.first_screen()
+            except Exception as e:
+                print("Goto failed:", e)
+                METRICS.count("tag_timeout" if is_timeout(e) else "tag_error", keyword, locale)
+                if feed:
+                    feed.close()
+                scheduler.drop(key)
+                ckpt.finish_pair(key, exhausted=True)
+                continue
+
+            seen_code, got_kw, queued = ckpt.resume_pair(key)
+            stagnant, last_height, page_loads = 0, 0, 1
+
+            while got_kw < PER_KEYWORD_LIMIT and total < TARGET_TOTAL:
+                if not queued:
+                    with METRICS.time("harvest"):
+                        if feed:
+                            posts, queued = feed.harvest(seen_code, keyword, locale)
+                        else:
+                            posts, queued = [], harvest_links(page, seen_code)
+                    if feed:
+                        # The feed is done once a few scrolls in a row bring nothing new.
+                        stagnant = 0 if posts or queued else stagnant + 1
+                        if stagnant:
+                            METRICS.count("scroll_stagnant", keyword, locale)
+                        if stagnant >= 3:
+                            METRICS.count("feed_end", keyword, locale)
+                            break
+                    parsed += len(posts)
+                    n = accept_posts(posts, emotion, keyword, locale,
+                                     min(PER_KEYWORD_LIMIT - got_kw, TARGET_TOTAL - total))
+                    got_kw += n
+                    total += n
+                    ckpt.update_pair(key, got_kw, queued, seen_code, total)
+                    save_classified(*stage.ready())
+                    METRICS.tick()  # feed posts often queue no fetches, so the fetch loop below may never tick
+                    if total >= TARGET_TOTAL or got_kw >= PER_KEYWORD_LIMIT:
                         break
 
-                    context = browser.new_context(
-                        locale=locale,
-                        extra_http_headers={"Accept-Language": accept},
-                        viewport={"width": 1920, "height": 1080},
-                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-                    )
-                    page = context.new_page()
-                    search_url = f"https://www.threads.net/tag/{quote(keyword)}"
-                    print(f"[{emotion}/{locale}] -> #{keyword}")
-
+                while queued:
+                    href = queued[0]
+                    started = time.perf_counter()
+                    page_loads += 1
                     try:
-                        page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
+                        html = guard.fetch(locale, lambda: fetch_post_html(
+                            pooled.context, http, href, accept, POST_PAGE_TIMEOUT, page=pooled.post_page()), keyword)
+                        with METRICS.time("parse"):
+                            posts = scrape_thread_page(html)
                     except Exception as e:
-                        print("Goto failed:", e)
-                        context.close()
-                        continue
-
-                    seen_code, got_kw, stagnant, last_height = set(), 0, 0, 0
-
-                    while got_kw < PER_KEYWORD_LIMIT and total < TARGET_TOTAL:
-                        links = page.locator('a[href*="/post/"]').all()
-                        for link in links:
-                            href = link.get_attribute("href")
-                            if not href or "post" not in href:
-                                continue
-                            if href.startswith("/"):
-                                href = "https://www.threads.net" + href
-                            post_code = href.split("/")[-1]
-                            if not post_code or post_code in seen_code:
-                                continue
-                            seen_code.add(post_code)
-
-                            try:
-                                p2 = context.new_page()
-                                p2.goto(href, wait_until="domcontentloaded", timeout=POST_PAGE_TIMEOUT)
-                                p2.wait_for_selector("[data-pressable-container=true]", timeout=8000)
-                                posts = scrape_thread_page(p2.content())
-                                p2.close()
-                            except Exception as e:
-                                print("Post load error:", e)
-                                continue
-
-                            for p in posts:
-                                pid, txt = str(p.get("id") or ""), p.get("text") or ""
-                                if not pid or pid in global_cache_ids:
-                                    continue
-                                if not keyword_in_text(txt, keyword):
-                                    continue
-
-                                p["keyword"], p["emotion"], p["locale_context"], p["lang_detect"] = (
-                                    keyword, emotion, locale, detect_language_safe(txt)
-                                )
-
-                                collected.append(p)
-                                global_cache_ids.add(pid)
-                                got_kw += 1
-                                total += 1
-                                progress += 1
-
-                                if len(collected) >= SHARD_SIZE:
-                                    save_shard(collected, shard_idx)
-                                    collected.clear()
-                                    shard_idx += 1
-
-                                if total >= TARGET_TOTAL or got_kw >= PER_KEYWORD_LIMIT:
-                                    break
-
-                        if total >= TARGET_TOTAL or got_kw >= PER_KEYWORD_LIMIT:
-                            break
-                        page.mouse.wheel(0, random.randint(2200, 3000))
-                        time.sleep(random.uniform(*SCROLL_SLEEP))
-                        try:
-                            new_height = page.evaluate("document.body.scrollHeight")
-                        except:
-                            new_height = last_height
-                        stagnant = stagnant + 1 if new_height == last_height else 0
-                        last_height = new_height
-                        if stagnant >= 3:
-                            break
-
-                    context.close()
-
-            if progress == 0:
-                print("No progress this rotation — stopping.")
-                break
+                        print("Post load error:", e)
+                        METRICS.count(f"post_{classify(e)}", keyword, locale)
+                        posts = []
+                    post_latency.append((time.perf_counter() - started) * 1000)
+                    parsed += len(posts)
+                    n = accept_posts(posts, emotion, keyword, locale,
+                                     min(PER_KEYWORD_LIMIT - got_kw, TARGET_TOTAL - total))
+                    got_kw += n
+                    total += n
+
+                    queued.pop(0)
+                    ckpt.update_pair(key, got_kw, queued, seen_code, total)
+                    save_classified(*stage.ready())
+                    METRICS.tick()
+                    if total >= TARGET_TOTAL or got_kw >= PER_KEYWORD_LIMIT:
+                        break
 
-        if collected:
-            save_shard(collected, shard_idx)
+                if total >= TARGET_TOTAL or got_kw >= PER_KEYWORD_LIMIT:
+                    break
+                if feed:
+                    feed.scroll(random.randint(2200, 3000), keyword, locale)
+                    continue
+                page.mouse.wheel(0, random.randint(2200, 3000))
+                time.sleep(random.uniform(*SCROLL_SLEEP))
+                try:
+                    new_height = page.evaluate("document.body.scrollHeight")
+                except:
+                    new_height = last_height
+                stagnant = stagnant + 1 if new_height == last_height else 0
+                last_height = new_height
+                if stagnant:
+                    METRICS.count("scroll_stagnant", keyword, locale)
+                if stagnant >= 3:
+                    METRICS.count("feed_end", keyword, locale)
+                    break
 
+            # A pair that hit the per-visit limit goes back to the scheduler; one that
+            # ran out of feed or gave nothing is done for this run.
+            if feed:
+                feed.close()
+            exhausted = got_kw == 0 or stagnant >= 3
+            scheduler.record(key, got_kw, page_loads, time.perf_counter() - visit_started, exhausted)
+            ckpt.finish_pair(key, exhausted)
+
+        rows = collected[:]
+        collected.clear()
+        save_rows(rows)
+        save_classified(*stage.close())
+        writer.close()
+        pool.close()
+
+    if http is not None:
+        http.close()
+
+    ckpt.clear()
+    if not shared:
+        global_cache_ids.close()
     print(f"Done. Collected total {total} posts (including shards).")
+    mode = "pooled contexts/pages" if REUSE_BROWSER else "new context per pair, new page per post"
+    print(f"Language tagging: {stats_summary()}")
+    print(f"Posts by emotion: {by_emotion}")
+    if CLASSIFY_MODEL:
+        print(f"Classified {stage.classified} posts with {CLASSIFY_MODEL} ({CLASSIFY_BACKEND}), "
+              f"{stage.rejected} dropped for disagreeing with their keyword emotion")
+    for line in scheduler.summary():
+        print(f"  {line}")
+    print(f"Per-post latency ({mode}): {latency_summary(post_latency)}, {pool.recycled} contexts recycled")
+    print(f"Fetches: {guard.summary()}")
+    if fixtures:
+        print(f"Fixtures {fixtures.summary()}")
+    METRICS.flush()
+    print("Stage timings:")
+    for line in METRICS.summary():
+        print(f"  {line}")
+    return {
+        "total": total, "parsed": parsed, "duplicates": duplicates,
+        "seconds": time.perf_counter() - started_run, "post_latency_ms": post_latency,
+        "retries": guard.stats["retries"],
+        "throttle_seconds": guard.stats["throttle_s"] + guard.stats["backoff_s"] + guard.stats["breaker_s"],
+    }
 
 if __name__ == "__main__":
     run_autoscrape()
@@ -0,0 +1,140 @@
+import hashlib, json, os, random, shutil
+import numpy as np
+import torch
+from torch.utils.data import Dataset, Sampler
+
+CACHE_ROOT = "data/english/prepared/token_cache/"
+TOKENIZE_BATCH = 10_000
+BUCKET_BATCHES = 50  # batches per length-sorted pool in LengthBucketSampler
+
+
+def cache_key(tokenizer, texts, labels, max_length):
+    """Hash of the tokenizer (vocabulary and settings), max_length and the exact texts and labels."""
+    h = hashlib.sha1()
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    h.update((backend.to_str() if backend is not None else tokenizer.name_or_path).encode("utf-8"))
+    h.update(f"{type(tokenizer).__name__}|{len(tokenizer)}|{max_length}".encode("utf-8"))
+    for text, label in zip(texts, labels):
+        h.update(text.encode("utf-8"))
+        h.update(f"\x00{label}\x01".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class TokenCache:
+    """Token ids of one split as memory-mapped arrays: every sequence back to back, plus offsets and labels."""
+
+    def __init__(self, path):
+        self.path = path
+        self.input_ids = np.load(os.path.join(path, "input_ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.lengths = np.diff(self.offsets)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+
+def load_or_build(tokenizer, texts, labels, max_length=128, root=None):
+    """TokenCache for these texts under `root` (CACHE_ROOT), tokenizing (unpadded, truncated) only when no cache matches."""
+    root = root or CACHE_ROOT
+    texts = [str(t) for t in texts]
+    labels = [int(l) for l in labels]
+    path = os.path.join(root, cache_key(tokenizer, texts, labels, max_length))
+    if os.path.exists(os.path.join(path, "meta.json")):
+        print(f"Token cache hit: {path}")
+        return TokenCache(path)
+
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    lengths, chunks = [], []
+    for i in range(0, len(texts), TOKENIZE_BATCH):
+        enc = tokenizer(texts[i:i + TOKENIZE_BATCH], truncation=True, max_length=max_length)
+        for ids in enc["input_ids"]:
+            lengths.append(len(ids))
+            chunks.append(np.asarray(ids, dtype=np.int32))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(os.path.join(tmp, "input_ids.npy"), np.concatenate(chunks) if chunks else np.empty(0, np.int32))
+    np.save(os.path.join(tmp, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp, "labels.npy"), np.asarray(labels, dtype=np.int64))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"rows": len(lengths), "tokens": int(offsets[-1]), "max_length": max_length,
+                   "pad_token_id": tokenizer.pad_token_id}, f)
+    os.replace(tmp, path)
+    print(f"Token cache built: {path} ({len(lengths)} rows, {int(offsets[-1])} tokens)")
+    return TokenCache(path)
+
+
+class TokenizedDataset(Dataset):
+    """Items are (ids, label) where ids is a view into the memory-mapped cache; nothing is copied here."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __getitem__(self, index):
+        c = self.cache
+        return c.input_ids[c.offsets[index]:c.offsets[index + 1]], c.labels[index]
+
+    def __len__(self):
+        return len(self.cache.lengths)
+
+
+def pad_collate(pad_token_id):
+    """collate_fn padding each batch only to its own longest sequence, in one copy into a preallocated array."""
+
+    def collate(items):
+        width = max(len(ids) for ids, _ in items)
+        input_ids = np.full((len(items), width), pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(items), width), dtype=np.int64)
+        for row, (ids, _) in enumerate(items):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        labels = np.fromiter((label for _, label in items), dtype=np.int64, count=len(items))
+        return {
+            "input_ids": torch.from_numpy(input_ids),
+            "attention_mask": torch.from_numpy(attention_mask),
+            "labels": torch.from_numpy(labels),
+        }
+
+    return collate
+
+
+class LengthBucketSampler(Sampler):
+    """Batches of similar-length rows, so dynamic padding adds little.
+
+    With shuffle, rows are shuffled, cut into pools of BUCKET_BATCHES
+    batches, sorted by length within each pool, and the resulting batches
+    are shuffled again. Without shuffle (evaluation), batches follow
+    global length order.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, seed=42, bucket_batches=None):
+        self.lengths, self.batch_size, self.shuffle = np.asarray(lengths), batch_size, shuffle
+        self.seed, self.bucket_batches, self.epoch = seed, bucket_batches or BUCKET_BATCHES, 0
+
+    def __iter__(self):
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind="stable")
+            yield from (order[i:i + self.batch_size].tolist() for i in range(0, len(order), self.batch_size))
+            return
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(len(self.lengths))
+        pool = self.batch_size * self.bucket_batches
+        batches = []
+        for start in range(0, len(order), pool):
+            chunk = order[start:start + pool]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind="stable")]
+            batches += [chunk[i:i + self.batch_size].tolist() for i in range(0, len(chunk), self.batch_size)]
+        random.Random(self.seed + self.epoch).shuffle(batches)
+        yield from batches
+
+    def __len__(self):
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+
+def padding_waste(lengths, batches):
+    """Fraction of padded positions when `batches` are padded per batch."""
+    lengths = np.asarray(lengths)
+    padded = sum(len(b) * lengths[b].max() for b in batches)
+    return 1 - lengths.sum() / padded if padded else 0.0